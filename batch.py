@@ -0,0 +1,310 @@
+#--- START OF FILE batch.py ---
+"""
+X_Grid バッチ計算 (画面を使わない一括計算)
+
+区域レイヤの地物を地物ID(または属性値)ごとにまとめ、各区域の平均集材距離を
+Project / Calculator / ReportGenerator で計算してCSVまたはGPKGへ順次書き出す。
+
+使用例:
+    python batch.py 林班.gpkg --layer ポリゴン --landing 土場 -o 結果.csv
+    python batch.py 林班.gpkg --layer 小班界 --group-by 小班 --landing optimal -o 結果.gpkg
+
+土場の指定:
+    optimal    : 区域内で平均集材距離が最小となるセルを土場とする
+    レイヤ名   : 土場レイヤ(点・線・面)の代表点を使用する。区域内に土場があれば
+                 そのセルを土場とし(区域内土場)、なければ最も近い土場に面した
+                 境界セルを入口として、土場までの距離を L とする(区域外土場)
+"""
+import argparse
+import contextlib
+import csv
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fiona
+from fiona.errors import FionaError
+import numpy as np
+import shapely
+from shapely.geometry import shape, mapping, MultiPolygon
+from shapely.ops import unary_union
+
+from project import Project
+from grid_transform import GridTransform
+from feature_table import FeatureTable
+from calculator import Calculator
+from report_generator import ReportGenerator
+
+LANDING_OPTIMAL = 'optimal'
+
+RESULT_FIELDS = [
+    ('group', 'str'), ('feature_count', 'int'), ('calc_mode', 'str'), ('landing_source', 'str'),
+    ('landing_row', 'int'), ('landing_col', 'int'), ('cell_count', 'int'),
+    ('total_product_v', 'int'), ('total_product_h', 'int'),
+    ('internal_distance', 'float'), ('additional_distance', 'float'), ('final_distance', 'float'),
+    ('report_distance', 'int'), ('area_ha', 'float'), ('coverage_area_ha', 'float'), ('paper', 'str'), ('map_rotation', 'int'),
+    ('error', 'str'),
+]
+
+
+def read_features(path, layer_name):
+    """レイヤの地物とジオメトリ型・座標系を読み込む (文字コードは画面からの読み込みと同じ順に試す)"""
+    try:
+        with fiona.open(path, 'r', layer=layer_name, encoding='utf-8') as c:
+            return list(c), c.schema.get('geometry', 'Unknown'), c.crs
+    except (FionaError, UnicodeDecodeError):
+        with fiona.open(path, 'r', layer=layer_name, encoding='cp932') as c:
+            return list(c), c.schema.get('geometry', 'Unknown'), c.crs
+
+
+def group_stands(features, group_by=None):
+    """地物を区域ごとにまとめ、(区域キー, 地物リスト) を初出順に返す。group_by 未指定時は地物IDごと"""
+    groups = {}
+    for feature in features:
+        if not feature.get('geometry'): continue
+        key = feature['properties'].get(group_by) if group_by else feature.get('id')
+        # プロセス間で受け渡せるよう、fionaの地物を辞書に変換する
+        groups.setdefault(str(key), []).append({
+            'id': feature.get('id'),
+            'geometry': mapping(shape(feature['geometry'])),
+            'properties': dict(feature['properties']),
+        })
+    return list(groups.items())
+
+
+def read_landing_points(path, layer_name):
+    """土場レイヤの各地物の代表点を (x, y) の配列として返す"""
+    features, _, _ = read_features(path, layer_name)
+    geoms = [shape(f['geometry']) for f in features if f.get('geometry')]
+    geoms = [g for g in geoms if not g.is_empty]
+    if not geoms:
+        return np.empty((0, 2))
+    return shapely.get_coordinates(shapely.point_on_surface(geoms))
+
+
+def build_project(features, path, layer_name, k_value, classification_mode):
+    """1区域分の地物から、画面を作らずに計算用の Project と Calculator を組み立てる"""
+    project = Project()
+    project.k_value = k_value
+    calculator = Calculator(project, GridTransform(project))
+    calculator.classification_mode = classification_mode
+    calculator.max_workers = 1
+    project.calculator = calculator
+
+    project.add_layer({
+        'path': path, 'layer_name': layer_name, 'geom_type': 'MultiPolygon', 'features': FeatureTable.from_features(features),
+        'graphics_items': [], 'is_calculable': True, 'is_calc_target': True
+    })
+    project.update_master_bbox()
+    project.determine_layout()
+    return project, calculator
+
+
+def _get_scene_cell(calculator, world_point):
+    """ワールド座標の点が含まれるセル (row, col) を返す。グリッド外の場合は None"""
+    transform, project = calculator.transform, calculator.project
+    scene_point = transform.world_to_scene(world_point.x, world_point.y)
+    if scene_point is None: return None
+    cs = project.cell_size_on_screen
+    row = math.floor((scene_point[1] - transform.grid_offset_y) / cs)
+    col = math.floor((scene_point[0] - transform.grid_offset_x) / cs)
+    if 0 <= row < project.grid_rows and 0 <= col < project.grid_cols:
+        return row, col
+    return None
+
+
+def _get_nearest_boundary_cell(calculator, world_geom, world_point):
+    """区域の境界に掛かるセルのうち、中心が土場に最も近いセルを返す"""
+    transform, project = calculator.transform, calculator.project
+    rows, cols = np.nonzero(calculator.get_boundary_cell_mask(world_geom))
+    scene_point = transform.world_to_scene(world_point.x, world_point.y)
+    if len(rows) == 0 or scene_point is None: return None
+    cs = project.cell_size_on_screen
+    center_x = transform.grid_offset_x + (cols + 0.5) * cs
+    center_y = transform.grid_offset_y + (rows + 0.5) * cs
+    nearest = int(np.argmin((center_x - scene_point[0]) ** 2 + (center_y - scene_point[1]) ** 2))
+    return int(rows[nearest]), int(cols[nearest])
+
+
+def resolve_landing(calculator, world_geom, landing):
+    """
+    土場の指定から (計算モード, 土場セル, 追加距離L, 土場の決め方) を決める。
+    landing は 'optimal' または土場の代表点の配列。
+    """
+    if isinstance(landing, str) and landing == LANDING_OPTIMAL:
+        cell, _ = calculator.find_optimal_landing(world_geom, 'internal')
+        return 'internal', cell, 0.0, LANDING_OPTIMAL
+
+    if len(landing) == 0:
+        return None, None, 0.0, 'no_landing'
+
+    points = shapely.points(landing)
+    shapely.prepare(world_geom)
+    inside = np.flatnonzero(shapely.contains(world_geom, points))
+    if len(inside) > 0:
+        return 'internal', _get_scene_cell(calculator, points[inside[0]]), 0.0, f'point#{inside[0]}'
+
+    distances = shapely.distance(world_geom, points)
+    nearest = int(np.argmin(distances))
+    cell = _get_nearest_boundary_cell(calculator, world_geom, points[nearest])
+    return 'external', cell, float(distances[nearest]), f'point#{nearest}'
+
+
+def _get_report_distance(project, group_key):
+    """総括表と同じ丸め規則で、区域の平均集材距離 (m, 整数) を求める"""
+    project.calculation_data['subtitle_text'] = group_key
+    for block in ReportGenerator().generate_summary_data(project):
+        if block['type'] == 'final_result':
+            return int(block['text'].split('=')[-1].strip().rstrip('m').strip())
+    return None
+
+
+def calculate_stand(task):
+    """1区域の平均集材距離を計算し、出力用の1行を返す (プロセスプールから呼ばれる)"""
+    group_key, features, options = task
+    row = {name: None for name, _ in RESULT_FIELDS}
+    row.update({'group': group_key, 'feature_count': len(features), 'error': ''})
+    try:
+        project, calculator = build_project(features, options['path'], options['layer'], options['k_value'], options['classification_mode'])
+        world_geom = project._get_combined_calculable_geom()
+        if world_geom is None or world_geom.is_empty:
+            raise ValueError("計算対象のポリゴンが見つかりません。")
+        row.update({
+            'paper': 'A4' if project.grid_cols == project.grid_cols_a4 else 'A3',
+            'map_rotation': project.map_rotation,
+        })
+
+        calc_mode, landing_cell, additional_distance, landing_source = resolve_landing(calculator, world_geom, options['landing'])
+        row['landing_source'] = landing_source
+        if landing_cell is None:
+            raise ValueError("土場のセルを決定できませんでした。")
+
+        project.default_calc_mode = calc_mode
+        project.default_landing_cell = landing_cell
+        project.default_additional_distance = additional_distance
+        calc_data = calculator.run_calculation()
+        if not calc_data:
+            raise ValueError("計算対象となるセルがありません。")
+        project.calculation_data = calc_data
+
+        result = calc_data['summary_result']
+        row.update({
+            'calc_mode': calc_mode, 'landing_row': result['landing_row'], 'landing_col': result['landing_col'],
+            'cell_count': result['total_degree'],
+            'total_product_v': result['total_product_v'], 'total_product_h': result['total_product_h'],
+            'internal_distance': result['internal_distance'], 'additional_distance': result['additional_distance'],
+            'final_distance': result['final_distance'],
+            'report_distance': _get_report_distance(project, group_key),
+            'area_ha': result['total_degree'] * (project.k_value ** 2) / 10000,
+            'coverage_area_ha': result['coverage_area_ha'],
+        })
+    except Exception as e:
+        row['error'] = str(e)
+    return row
+
+
+class CsvResultWriter:
+    def __init__(self, path):
+        # Excelで開いても文字化けしないようBOM付きUTF-8で書き出す
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.DictWriter(self.file, fieldnames=[name for name, _ in RESULT_FIELDS])
+        self.writer.writeheader()
+
+    def write(self, row, geom):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class GpkgResultWriter:
+    def __init__(self, path, crs):
+        schema = {'geometry': 'MultiPolygon', 'properties': dict(RESULT_FIELDS)}
+        self.collection = fiona.open(path, 'w', driver='GPKG', layer='xgrid_results', schema=schema, crs=crs)
+
+    def write(self, row, geom):
+        if geom.geom_type == 'Polygon':
+            geom = MultiPolygon([geom])
+        self.collection.write({'geometry': mapping(geom), 'properties': row})
+
+    def close(self):
+        self.collection.close()
+
+
+def run_batch(args):
+    features, geom_type, crs = read_features(args.input, args.layer)
+    if "Polygon" not in geom_type:
+        raise ValueError(f"レイヤ '{args.layer}' はポリゴンレイヤではありません。")
+    if crs and crs.get('proj') == 'longlat':
+        print("警告: 地理座標系の可能性があります。平面直角座標系のデータを使用してください。", file=sys.stderr)
+
+    stands = group_stands(features, args.group_by)
+    landing = LANDING_OPTIMAL if args.landing == LANDING_OPTIMAL else read_landing_points(args.landing_file or args.input, args.landing)
+    options = {
+        'path': args.input, 'layer': args.layer, 'k_value': args.k,
+        'classification_mode': args.classification, 'landing': landing,
+    }
+    tasks = [(key, stand_features, options) for key, stand_features in stands]
+
+    if args.output.lower().endswith('.gpkg'):
+        writer = GpkgResultWriter(args.output, crs)
+    else:
+        writer = CsvResultWriter(args.output)
+
+    workers = args.workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    error_count = 0
+    use_processes = workers > 1 and len(tasks) > 1
+    try:
+        # 書き出し中に例外が起きても、with を抜けるときにワーカープロセスを終了させる
+        with ProcessPoolExecutor(max_workers=workers) if use_processes else contextlib.nullcontext() as executor:
+            if executor:
+                # 区域の順序を保ったまま、計算の終わった区域から順に書き出す
+                results = executor.map(calculate_stand, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+            else:
+                results = map(calculate_stand, tasks)
+
+            for i, ((key, stand_features, _), row) in enumerate(zip(tasks, results), start=1):
+                writer.write(row, unary_union([shape(f['geometry']) for f in stand_features]))
+                if row['error']:
+                    error_count += 1
+                    print(f"[{key}] エラー: {row['error']}", file=sys.stderr)
+                if i % args.progress_interval == 0:
+                    elapsed = time.perf_counter() - start_time
+                    print(f"{i}/{len(tasks)} 区域 ({i / elapsed:.1f} 区域/秒)", file=sys.stderr)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start_time
+    throughput = len(tasks) / elapsed if elapsed > 0 else 0
+    print(f"完了: {len(tasks)} 区域 (エラー {error_count} 件) / {elapsed:.2f} 秒 / {throughput:.1f} 区域/秒 / {workers} プロセス", file=sys.stderr)
+    return error_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="X_Grid 平均集材距離のバッチ計算")
+    parser.add_argument('input', help="区域レイヤを含むファイル (.gpkg, .shp など)")
+    # 土場もポリゴンで作られていることが多く、先頭のレイヤやポリゴンレイヤを既定にはできないため必須とする
+    parser.add_argument('--layer', required=True, help="区域レイヤ名")
+    parser.add_argument('--group-by', help="区域をまとめる属性名 (省略時は地物ごと)")
+    parser.add_argument('--landing', default=LANDING_OPTIMAL, help="土場レイヤ名、または 'optimal' (既定)")
+    parser.add_argument('--landing-file', help="土場レイヤを含むファイル (省略時は入力ファイル)")
+    parser.add_argument('-o', '--output', required=True, help="出力ファイル (.csv または .gpkg)")
+    parser.add_argument('--k', type=float, default=25.0, help="セル定数 k (m)")
+    parser.add_argument('--classification', default='prepared', choices=Calculator.CLASSIFICATION_MODES, help="セル判定の方式")
+    parser.add_argument('--workers', type=int, default=None, help="並列プロセス数 (省略時はCPUコア数)")
+    parser.add_argument('--progress-interval', type=int, default=50, help="進捗を表示する区域数の間隔")
+    args = parser.parse_args(argv)
+
+    try:
+        error_count = run_batch(args)
+    except (FionaError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    return 1 if error_count else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
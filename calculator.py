@@ -1,10 +1,57 @@
 from shapely.geometry import Polygon, MultiPolygon, box
+import shapely
+import numpy as np
 import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 class Calculator:
-    def __init__(self, project, renderer):
+    # セル判定(50%面積ルール)の実装方式
+    #   'loop'       : セルごとに box を作成して判定する従来の実装 (回帰確認用)
+    #   'vectorized' : 候補セルを配列としてまとめて作成し、shapely 2.x のufuncで一括判定する
+    #   'prepared'   : ジオメトリをprepareし、完全に内側/外側のセルは面積計算を省略する
+    #   'scanline'   : ポリゴンの辺を1回走査し、全セルの被覆率をNumPyのみで厳密に求める
+    # いずれの方式も grid_rows x grid_cols の被覆率配列(セル面積に対する区域の割合)を返す。
+    CLASSIFICATION_MODES = ('loop', 'vectorized', 'prepared', 'scanline')
+    # 50%面積ルールの閾値 (被覆率)
+    AREA_RATIO_THRESHOLD = 0.5
+    # 被覆率キャッシュの最大保持数 (LRU)
+    COVERAGE_CACHE_SIZE = 32
+
+    def __init__(self, project, transform):
         self.project = project
-        self.renderer = renderer
+        # ワールド座標とシーン座標の変換 (GridTransform)。描画用のシーンを持たずに計算できる
+        self.transform = transform
+        self.classification_mode = 'prepared'
+        # 分割計算で各区域を並列に計算するスレッド数 (None: CPUコア数, 1: 逐次計算)
+        # shapely 2.x のGEOS処理はGILを解放するため、スレッドで並列化できる
+        self.max_workers = None
+        # 分割計算で全区域の被覆率を1回の走査で求め、セルの帰属をまとめて判定する (False: 区域ごとに判定)
+        self.use_coverage_stack = True
+        # 再描画のたびにセル判定をやり直さないよう、ジオメトリとレイアウトごとに被覆率を保持する
+        self._coverage_cache = OrderedDict()
+        self._coverage_cache_lock = threading.Lock()
+
+    def invalidate_coverage_cache(self):
+        """レイヤ・計算対象・分割線が変更されたときに被覆率キャッシュを破棄する"""
+        with self._coverage_cache_lock:
+            self._coverage_cache.clear()
+
+    def _get_coverage_cache_key(self, world_geoms):
+        """
+        被覆率を一意に決めるジオメトリとレイアウト条件の組をキーとする。
+        ジオメトリは値のハッシュ計算を避けるため id で区別する (結合ジオメトリは作り直されるまで同じオブジェクト)。
+        """
+        return (
+            tuple(id(geom) for geom in world_geoms),
+            self.project.map_rotation, self.project.map_offset_x, self.project.map_offset_y,
+            self.project.grid_rows, self.project.grid_cols, self.project.k_value,
+            tuple(self.project.master_bbox), self.project.cell_size_on_screen,
+            self.transform.grid_offset_x, self.transform.grid_offset_y,
+            self.classification_mode
+        )
 
     def run_calculation(self):
         """
@@ -49,8 +96,12 @@ class Calculator:
         summary_row_counts = {r: 0 for r in range(self.project.grid_rows)}
         summary_col_counts = {c: 0 for c in range(self.project.grid_cols)}
         
-        for area_data in self.project.sub_area_data:
-            result = self._calculate_for_area(area_data)
+        if self.use_coverage_stack:
+            results = self._calculate_areas_from_stack(self.project.sub_area_data)
+        else:
+            # 区域ごとの計算は独立しているため並列に実行し、結果は区域の順に集計する
+            results = self._calculate_areas(self.project.sub_area_data)
+        for area_data, result in zip(self.project.sub_area_data, results):
             if not result: continue
             area_data['result'] = result
             
@@ -81,8 +132,51 @@ class Calculator:
         
         return {'summary_result': summary_result}
 
-    def _calculate_for_area(self, area_data):
-        """指定されたエリアのデータに基づいて平均集材距離を計算する"""
+    def _calculate_areas(self, area_data_list):
+        """複数エリアの計算をスレッドプールで並列に実行し、入力と同じ順序で結果を返す"""
+        max_workers = self.max_workers or os.cpu_count() or 1
+        max_workers = min(max_workers, len(area_data_list))
+        if max_workers <= 1:
+            return [self._calculate_for_area(area_data) for area_data in area_data_list]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._calculate_for_area, area_data_list))
+
+    def _calculate_areas_from_stack(self, area_data_list):
+        """
+        全区域の被覆率を1回の走査で求め、各区域の対象セルと行・列ごとのセル数を一括で集計する。
+        """
+        coverage_stack = self.get_coverage_stack_for_geoms([area_data['geom'] for area_data in area_data_list])
+        cell_stats = self._get_cell_stats_from_stack(coverage_stack)
+        return [
+            self._calculate_for_area(area_data, coverage=coverage_stack[i], cell_stats=cell_stats[i])
+            for i, area_data in enumerate(area_data_list)
+        ]
+
+    def _get_cell_stats_from_stack(self, coverage_stack):
+        """
+        被覆率配列 (区域数 x grid_rows x grid_cols) に区域ごとに50%面積ルールを適用し、
+        区域ごとの (対象セル, 行ごとのセル数, 列ごとのセル数) を求める。
+        区域ごとの判定と同じく、ちょうど50%ずつの境界セルは両方の区域に数える。
+        """
+        in_area = coverage_stack >= self.AREA_RATIO_THRESHOLD
+        row_count_table = in_area.sum(axis=2)
+        col_count_table = in_area.sum(axis=1)
+
+        cell_stats = []
+        for i in range(len(coverage_stack)):
+            rows, cols = np.nonzero(in_area[i])
+            in_area_cells = list(zip(rows.tolist(), cols.tolist()))
+            row_counts = dict(enumerate(row_count_table[i].tolist()))
+            col_counts = dict(enumerate(col_count_table[i].tolist()))
+            cell_stats.append((in_area_cells, row_counts, col_counts))
+        return cell_stats
+
+    def _calculate_for_area(self, area_data, coverage=None, cell_stats=None):
+        """
+        指定されたエリアのデータに基づいて平均集材距離を計算する。
+        被覆率配列から集計済みの場合は coverage と cell_stats を受け取り、セル判定を省略する。
+        """
         world_geom = area_data['geom']
         
         calc_mode = area_data['calc_mode']
@@ -94,14 +188,19 @@ class Calculator:
         
         landing_row, landing_col = landing_cell
         
-        in_area_cells = self.get_cells_for_geom(world_geom)
-        if not in_area_cells: return None
-
-        row_counts = {r: 0 for r in range(self.project.grid_rows)}
-        col_counts = {c: 0 for c in range(self.project.grid_cols)}
-        for r, c in in_area_cells:
-            row_counts[r] += 1
-            col_counts[c] += 1
+        if cell_stats is not None:
+            in_area_cells, row_counts, col_counts = cell_stats
+            if not in_area_cells: return None
+        else:
+            coverage = self.get_coverage_for_geom(world_geom)
+            in_area_cells = self._get_cells_from_coverage(coverage)
+            if not in_area_cells: return None
+
+            row_counts = {r: 0 for r in range(self.project.grid_rows)}
+            col_counts = {c: 0 for c in range(self.project.grid_cols)}
+            for r, c in in_area_cells:
+                row_counts[r] += 1
+                col_counts[c] += 1
         
         total_product_v = sum(abs(r - landing_row) * count for r, count in row_counts.items())
         total_product_h = sum(abs(c - landing_col) * count for c, count in col_counts.items())
@@ -125,28 +224,103 @@ class Calculator:
             "total_degree": total_degree, "in_area_cells": in_area_cells,
             "min_row": min(all_rows) if all_rows else 0, "max_row": max(all_rows) if all_rows else 0,
             "min_col": min(all_cols) if all_cols else 0, "max_col": max(all_cols) if all_cols else 0,
+            # セルの被覆率の合計から求めた区域の実面積 (ha)。帳票とバッチ出力に参考値として載せる
+            "coverage_area_ha": float(coverage.sum()) * (self.project.k_value ** 2) / 10000,
             "is_summary": False
         }
 
-    def is_cell_in_area(self, cell, world_geom):
+    @staticmethod
+    def _get_axis_distance_sums(counts):
         """
-        【土場選択用】指定されたセルが、ジオメトリと少しでも交差するかを判定する。
-        計算対象セルの定義（面積50%ルール）とは異なり、単純な交差判定を行う。
+        各インデックス i について Σ|j - i| * counts[j] を累積和で一括計算する。
+        集材距離は縦・横に分離できるため、全ての土場候補の⑨・⑦を O(行数+列数) で求められる。
         """
-        if not cell or not world_geom or not world_geom.is_valid:
-            return False
-        
-        row, col = cell
-        # Rendererの機能を使って、指定されたセルのワールド座標ポリゴンを取得
-        cell_world_poly = self.renderer.get_cell_world_polygon(row, col)
-        if not cell_world_poly:
-            return False
+        counts = np.asarray(counts, dtype=np.int64)
+        positions = np.arange(len(counts), dtype=np.int64)
+        count_le = np.cumsum(counts)
+        weighted_le = np.cumsum(positions * counts)
+        total_count, total_weighted = count_le[-1], weighted_le[-1]
+        below = positions * count_le - weighted_le
+        above = (total_weighted - weighted_le) - positions * (total_count - count_le)
+        return below + above
+
+    def get_landing_distance_grid(self, coverage):
+        """
+        全てのセルをそれぞれ土場とした場合の区域内平均集材距離 ((⑨ + ⑦) ÷ ⑧ × K) を
+        grid_rows x grid_cols の配列として返す。対象セルがない場合は None を返す。
+        """
+        in_area = coverage >= self.AREA_RATIO_THRESHOLD
+        total_degree = int(in_area.sum())
+        if total_degree == 0: return None
+
+        product_v = self._get_axis_distance_sums(in_area.sum(axis=1))
+        product_h = self._get_axis_distance_sums(in_area.sum(axis=0))
+        return (product_v[:, np.newaxis] + product_h[np.newaxis, :]) / total_degree * self.project.k_value
+
+    def get_boundary_cell_mask(self, world_geom):
+        """【区域入口選択用】ジオメトリの境界線と交差するセルを真とする配列を返す"""
+        mask = np.zeros((self.project.grid_rows, self.project.grid_cols), dtype=bool)
+        if not self.project.master_bbox or world_geom is None or world_geom.is_empty: return mask
+
+        scene_geom = self.transform.world_geom_to_scene_geom(world_geom)
+        if not scene_geom or scene_geom.is_empty: return mask
+        return self._get_intersecting_cell_mask(scene_geom.boundary)
+
+    def get_landing_cell_mask(self, world_geom, calc_mode):
+        """
+        【土場選択用】土場(内部)または区域入口(外部)として指定できるセルを真とする配列を返す。
+        内部の場合はジオメトリと少しでも交差するセル (面積50%ルールとは異なる)、外部の場合は境界線と交差するセル。
+        プレビュー表示とクリック時の判定はどちらもこの配列を使う。
+        """
+        if calc_mode == 'external':
+            return self.get_boundary_cell_mask(world_geom)
+        mask = np.zeros((self.project.grid_rows, self.project.grid_cols), dtype=bool)
+        if not self.project.master_bbox or world_geom is None or world_geom.is_empty: return mask
+        scene_geom = self.transform.world_geom_to_scene_geom(world_geom)
+        if not scene_geom or scene_geom.is_empty: return mask
+        return self._get_intersecting_cell_mask(scene_geom)
+
+    def _get_intersecting_cell_mask(self, scene_geom):
+        """シーンジオメトリと交差する (接するだけのものを含む) セルを真とする配列を返す"""
+        mask = np.zeros((self.project.grid_rows, self.project.grid_cols), dtype=bool)
+        start_row, end_row, start_col, end_col = self._get_candidate_cell_range(scene_geom)
+        # 外接矩形の辺がセルの境界に一致する場合に接するセルも候補に含めるため、1セル広げる
+        start_row, start_col = max(0, start_row - 1), max(0, start_col - 1)
+        end_row, end_col = min(self.project.grid_rows, end_row + 1), min(self.project.grid_cols, end_col + 1)
+        if start_row >= end_row or start_col >= end_col: return mask
+
+        rows, cols = np.meshgrid(np.arange(start_row, end_row), np.arange(start_col, end_col), indexing='ij')
+        rows, cols = rows.ravel(), cols.ravel()
+        shapely.prepare(scene_geom)
+        mask[rows, cols] = shapely.intersects(scene_geom, self._build_cell_boxes(rows, cols))
+        return mask
+
+    def find_optimal_landing(self, world_geom, calc_mode):
+        """
+        区域内平均集材距離が最小となる土場(内部)または区域入口(外部)のセルを探す。
+        候補は、内部の場合は50%面積ルールの対象セル、外部の場合は境界線上のセルに限定する。
+        戻り値は ((row, col), 区域内平均集材距離)。見つからない場合は (None, None)。
+        """
+        coverage = self.get_coverage_for_geom(world_geom)
+        distance_grid = self.get_landing_distance_grid(coverage)
+        if distance_grid is None: return None, None
+
+        if calc_mode == 'external':
+            candidates = self.get_boundary_cell_mask(world_geom)
+        else:
+            candidates = coverage >= self.AREA_RATIO_THRESHOLD
+        if not candidates.any(): return None, None
 
-        # ワールドジオメトリとセルのワールドポリゴンが交差するかどうかを判定
-        return world_geom.intersects(cell_world_poly)
+        masked = np.where(candidates, distance_grid, np.inf)
+        row, col = np.unravel_index(np.argmin(masked), masked.shape)
+        return (int(row), int(col)), float(masked[row, col])
 
     def get_in_area_cells(self):
         """現在表示対象となっているエリアのセルを取得する"""
+        return self._get_cells_from_coverage(self.get_in_area_coverage())
+
+    def get_in_area_coverage(self):
+        """現在表示対象となっているエリアの被覆率配列を取得する"""
         world_geom = None
         if self.project.display_mode == 'summary':
             world_geom = self.project._get_combined_calculable_geom()
@@ -161,34 +335,284 @@ class Calculator:
         else:
             world_geom = self.project._get_combined_calculable_geom()
 
-        if world_geom is None or world_geom.is_empty:
-            return []
-
-        return self.get_cells_for_geom(world_geom)
+        return self.get_coverage_for_geom(world_geom)
 
     def get_cells_for_geom(self, world_geom):
         """指定されたワールドジオメトリに含まれるセルを取得する"""
-        if not self.project.master_bbox: return []
-        if world_geom is None or world_geom.is_empty: return []
+        return self._get_cells_from_coverage(self.get_coverage_for_geom(world_geom))
 
-        scene_geom = self.renderer.world_geom_to_scene_geom(world_geom)
-        if not scene_geom: return []
+    def get_coverage_for_geom(self, world_geom):
+        """
+        指定されたワールドジオメトリについて、グリッド全体の被覆率配列
+        (grid_rows x grid_cols, 0.0〜1.0) を取得する。
+        """
+        empty = np.zeros((self.project.grid_rows, self.project.grid_cols))
+        if not self.project.master_bbox: return empty
+        if world_geom is None or world_geom.is_empty: return empty
+
+        cache_key = self._get_coverage_cache_key((world_geom,))
+        coverage = self._get_cached_coverage(cache_key, (world_geom,))
+        if coverage is not None: return coverage
 
-        return self._get_cells_in_scene_geom(scene_geom)
+        scene_geom = self.transform.world_geom_to_scene_geom(world_geom)
+        if not scene_geom or scene_geom.is_empty: return empty
 
-    def _get_cells_in_scene_geom(self, scene_geom):
-        if not scene_geom or scene_geom.is_empty: return []
-        in_area_cells, area_threshold = [], 0.5 * (self.project.cell_size_on_screen ** 2)
-        grid_offset_x, grid_offset_y = self.renderer.grid_offset_x, self.renderer.grid_offset_y
+        coverage = self._get_coverage_in_scene_geom(scene_geom)
+        self._store_cached_coverage(cache_key, (world_geom,), coverage)
+        return coverage
+
+    def get_coverage_stack_for_geoms(self, world_geoms):
+        """
+        複数のワールドジオメトリについて、被覆率配列を重ねた
+        (ジオメトリ数 x grid_rows x grid_cols) の配列を1回のグリッド走査で取得する。
+        """
+        grid_rows, grid_cols = self.project.grid_rows, self.project.grid_cols
+        empty = np.zeros((len(world_geoms), grid_rows, grid_cols))
+        if not self.project.master_bbox or not world_geoms: return empty
+
+        source_geoms = tuple(world_geoms)
+        cache_key = self._get_coverage_cache_key(source_geoms)
+        coverage_stack = self._get_cached_coverage(cache_key, source_geoms)
+        if coverage_stack is not None: return coverage_stack
+
+        world_geoms = np.array(world_geoms, dtype=object)
+        world_geoms[shapely.is_empty(world_geoms)] = None
+        scene_geoms = self.transform.transform_geoms(world_geoms)
+
+        if self.classification_mode == 'scanline':
+            coverage_stack = self._get_coverage_stack_scanline(scene_geoms)
+        else:
+            coverage_stack = self._get_coverage_stack_geos(scene_geoms)
+        self._store_cached_coverage(cache_key, source_geoms, coverage_stack)
+        return coverage_stack
+
+    def _get_cached_coverage(self, cache_key, world_geoms):
+        """キャッシュ済みの被覆率配列を返す。同じ id の別ジオメトリ (作り直されたもの) の場合は None"""
+        with self._coverage_cache_lock:
+            cached = self._coverage_cache.get(cache_key)
+            if cached is None or not all(a is b for a, b in zip(cached[0], world_geoms)): return None
+            self._coverage_cache.move_to_end(cache_key)
+            return cached[1]
+
+    def _store_cached_coverage(self, cache_key, world_geoms, coverage):
+        """被覆率配列を、元のジオメトリへの参照 (id の再利用を防ぐ) とともにキャッシュする"""
+        # キャッシュした配列が呼び出し側で書き換えられないよう読み取り専用にする
+        coverage.flags.writeable = False
+        with self._coverage_cache_lock:
+            self._coverage_cache[cache_key] = (world_geoms, coverage)
+            if len(self._coverage_cache) > self.COVERAGE_CACHE_SIZE:
+                self._coverage_cache.popitem(last=False)
+
+    def _get_cells_from_coverage(self, coverage):
+        """被覆率配列に50%面積ルールを適用し、対象セルを行優先の順で返す"""
+        rows, cols = np.nonzero(coverage >= self.AREA_RATIO_THRESHOLD)
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    def _get_candidate_cell_range(self, scene_geom):
+        """シーンジオメトリの外接矩形に掛かるセルの行・列範囲を返す"""
+        cs = self.project.cell_size_on_screen
+        grid_offset_x, grid_offset_y = self.transform.grid_offset_x, self.transform.grid_offset_y
         min_x, min_y, max_x, max_y = scene_geom.bounds
-        start_col = max(0, int((min_x - grid_offset_x) / self.project.cell_size_on_screen))
-        end_col = min(self.project.grid_cols, int((max_x - grid_offset_x) / self.project.cell_size_on_screen) + 1)
-        start_row = max(0, int((min_y - grid_offset_y) / self.project.cell_size_on_screen))
-        end_row = min(self.project.grid_rows, int((max_y - grid_offset_y) / self.project.cell_size_on_screen) + 1)
+        start_col = max(0, int((min_x - grid_offset_x) / cs))
+        end_col = min(self.project.grid_cols, int((max_x - grid_offset_x) / cs) + 1)
+        start_row = max(0, int((min_y - grid_offset_y) / cs))
+        end_row = min(self.project.grid_rows, int((max_y - grid_offset_y) / cs) + 1)
+        return start_row, end_row, start_col, end_col
+
+    def _get_coverage_in_scene_geom(self, scene_geom):
+        if self.classification_mode == 'loop':
+            return self._get_coverage_loop(scene_geom)
+        if self.classification_mode == 'vectorized':
+            return self._get_coverage_vectorized(scene_geom)
+        if self.classification_mode == 'scanline':
+            return self._get_coverage_scanline(scene_geom)
+        return self._get_coverage_prepared(scene_geom)
+
+    def _get_coverage_loop(self, scene_geom):
+        coverage = np.zeros((self.project.grid_rows, self.project.grid_cols))
+        cell_area = self.project.cell_size_on_screen ** 2
+        grid_offset_x, grid_offset_y = self.transform.grid_offset_x, self.transform.grid_offset_y
+        start_row, end_row, start_col, end_col = self._get_candidate_cell_range(scene_geom)
         for r in range(start_row, end_row):
             for c in range(start_col, end_col):
                 cell_poly = box(grid_offset_x + c * self.project.cell_size_on_screen, grid_offset_y + r * self.project.cell_size_on_screen, grid_offset_x + (c + 1) * self.project.cell_size_on_screen, grid_offset_y + (r + 1) * self.project.cell_size_on_screen)
                 
-                if scene_geom.intersects(cell_poly) and scene_geom.intersection(cell_poly).area >= area_threshold:
-                    in_area_cells.append((r, c))
-        return in_area_cells
\ No newline at end of file
+                if scene_geom.intersects(cell_poly):
+                    coverage[r, c] = scene_geom.intersection(cell_poly).area / cell_area
+        return coverage
+
+    def _build_cell_boxes(self, rows, cols):
+        """行・列インデックス配列に対応するセルのシーン座標ポリゴン配列を作成する"""
+        cs = self.project.cell_size_on_screen
+        x1 = self.transform.grid_offset_x + cols * cs
+        y1 = self.transform.grid_offset_y + rows * cs
+        return shapely.box(x1, y1, x1 + cs, y1 + cs)
+
+    def _get_candidate_cells(self, scene_geom):
+        """候補セルの行・列インデックス配列とセルポリゴン配列を行優先の順で返す"""
+        start_row, end_row, start_col, end_col = self._get_candidate_cell_range(scene_geom)
+        if start_row >= end_row or start_col >= end_col:
+            empty = np.empty(0, dtype=int)
+            return empty, empty, np.empty(0, dtype=object)
+
+        rows, cols = np.meshgrid(np.arange(start_row, end_row), np.arange(start_col, end_col), indexing='ij')
+        rows, cols = rows.ravel(), cols.ravel()
+        return rows, cols, self._build_cell_boxes(rows, cols)
+
+    def _get_coverage_vectorized(self, scene_geom):
+        """候補セルを一括で作成し、交差判定と交差面積の計算をベクトル化して行う"""
+        coverage = np.zeros((self.project.grid_rows, self.project.grid_cols))
+        rows, cols, cells = self._get_candidate_cells(scene_geom)
+        if len(cells) == 0: return coverage
+
+        hit = shapely.intersects(scene_geom, cells)
+        if hit.any():
+            areas = shapely.area(shapely.intersection(scene_geom, cells[hit]))
+            coverage[rows[hit], cols[hit]] = areas / (self.project.cell_size_on_screen ** 2)
+        return coverage
+
+    def _get_coverage_prepared(self, scene_geom):
+        """
+        ジオメトリを一度だけprepareし、セルを内部/外部/境界に分類する。
+        内部セルは面積計算なしで被覆率1とし、外部セルは即座に除外し、
+        境界セルのみ交差面積を計算する。
+        """
+        coverage = np.zeros((self.project.grid_rows, self.project.grid_cols))
+        rows, cols, cells = self._get_candidate_cells(scene_geom)
+        if len(cells) == 0: return coverage
+
+        shapely.prepare(scene_geom)
+        hit = shapely.intersects(scene_geom, cells)
+        if hit.any():
+            hit_indices = np.flatnonzero(hit)
+            is_inside = shapely.contains(scene_geom, cells[hit_indices])
+            inside_indices = hit_indices[is_inside]
+            coverage[rows[inside_indices], cols[inside_indices]] = 1.0
+
+            boundary_indices = hit_indices[~is_inside]
+            if len(boundary_indices) > 0:
+                areas = shapely.area(shapely.intersection(scene_geom, cells[boundary_indices]))
+                coverage[rows[boundary_indices], cols[boundary_indices]] = areas / (self.project.cell_size_on_screen ** 2)
+        return coverage
+
+    def _get_coverage_stack_geos(self, scene_geoms):
+        """
+        全ジオメトリの外接範囲の候補セルを1回だけ作成し、STRtreeで
+        (セル, ジオメトリ) の交差ペアを求めて、ペアごとに被覆率を計算する。
+        """
+        coverage_stack = np.zeros((len(scene_geoms), self.project.grid_rows, self.project.grid_cols))
+        valid = np.flatnonzero(shapely.is_geometry(scene_geoms))
+        if len(valid) == 0: return coverage_stack
+
+        rows, cols, cells = self._get_candidate_cells(shapely.box(*shapely.total_bounds(scene_geoms[valid])))
+        if len(cells) == 0: return coverage_stack
+
+        cell_indices, tree_indices = shapely.STRtree(scene_geoms[valid]).query(cells, predicate='intersects')
+        if len(cell_indices) == 0: return coverage_stack
+        geom_indices = valid[tree_indices]
+        pair_geoms, pair_cells = scene_geoms[geom_indices], cells[cell_indices]
+
+        pair_coverage = np.ones(len(cell_indices))
+        is_boundary = np.ones(len(cell_indices), dtype=bool)
+        if self.classification_mode == 'prepared':
+            shapely.prepare(scene_geoms[valid])
+            is_boundary = ~shapely.contains(pair_geoms, pair_cells)
+        pair_coverage[is_boundary] = shapely.area(shapely.intersection(pair_geoms[is_boundary], pair_cells[is_boundary])) / (self.project.cell_size_on_screen ** 2)
+
+        coverage_stack[geom_indices, rows[cell_indices], cols[cell_indices]] = pair_coverage
+        return coverage_stack
+
+    def _get_coverage_scanline(self, scene_geom):
+        return self._get_coverage_stack_scanline(np.array([scene_geom], dtype=object))[0]
+
+    def _get_coverage_stack_scanline(self, scene_geoms):
+        """
+        ポリゴンの各辺をグリッド線で細分し、辺の1回の走査で全セルの被覆面積を厳密に求める。
+        各セルの面積は、辺に沿った ∫(clamp(y, セル上端, セル下端) - セル上端) dx の総和として得られる。
+        辺より上側(行番号が小さい側)のセルは列全体に同じ寄与を受けるため、差分配列の累積和で加算する。
+        複数のジオメトリの辺はまとめて走査し、ジオメトリごとの被覆率配列に振り分ける。
+        """
+        grid_rows, grid_cols = self.project.grid_rows, self.project.grid_cols
+        cs = float(self.project.cell_size_on_screen)
+        grid_offset_x, grid_offset_y = self.transform.grid_offset_x, self.transform.grid_offset_y
+        geom_count = len(scene_geoms)
+        coverage = np.zeros((geom_count, grid_rows, grid_cols))
+
+        parts, part_geom_index = shapely.get_parts(scene_geoms, return_index=True)
+        parts, part_index = shapely.get_parts(parts, return_index=True)
+        part_geom_index = part_geom_index[part_index]
+        is_polygon = (shapely.get_type_id(parts) == 3) & ~shapely.is_empty(parts)
+        polygons, polygon_geom_index = parts[is_polygon], part_geom_index[is_polygon]
+        if len(polygons) == 0: return coverage
+
+        # 外周は正、穴は負の面積として寄与するよう、リングごとに向きから符号を決める
+        rings, polygon_index = shapely.get_rings(polygons, return_index=True)
+        is_exterior = np.ones(len(rings), dtype=bool)
+        is_exterior[1:] = polygon_index[1:] != polygon_index[:-1]
+        ring_sign = np.where(shapely.is_ccw(rings), -1.0, 1.0) * np.where(is_exterior, 1.0, -1.0)
+
+        coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+        same_ring = ring_index[:-1] == ring_index[1:]
+        x0, y0 = coords[:-1, 0][same_ring], coords[:-1, 1][same_ring]
+        x1, y1 = coords[1:, 0][same_ring], coords[1:, 1][same_ring]
+        edge_sign = ring_sign[ring_index[:-1][same_ring]]
+        edge_geom = polygon_geom_index[polygon_index[ring_index[:-1][same_ring]]]
+
+        # 垂直な辺は dx = 0 のため寄与しない
+        is_sloped = x0 != x1
+        x0, y0, x1, y1, edge_sign, edge_geom = x0[is_sloped], y0[is_sloped], x1[is_sloped], y1[is_sloped], edge_sign[is_sloped], edge_geom[is_sloped]
+        if len(x0) == 0: return coverage
+        dx, dy = x1 - x0, y1 - y0
+
+        # 辺がグリッド線と交わる位置をパラメータ t (0〜1) として列挙する
+        def crossing_params(v0, v1, dv, origin, line_count):
+            lo = np.clip(np.ceil((np.minimum(v0, v1) - origin) / cs), 0, line_count + 1).astype(np.int64)
+            hi = np.clip(np.floor((np.maximum(v0, v1) - origin) / cs), -1, line_count).astype(np.int64)
+            counts = np.where(dv != 0, np.maximum(hi - lo + 1, 0), 0)
+            edge_ids = np.repeat(np.arange(len(v0)), counts)
+            line_ids = lo[edge_ids] + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+            return edge_ids, (origin + line_ids * cs - v0[edge_ids]) / dv[edge_ids]
+
+        edge_ids_x, t_x = crossing_params(x0, x1, dx, grid_offset_x, grid_cols)
+        edge_ids_y, t_y = crossing_params(y0, y1, dy, grid_offset_y, grid_rows)
+        edge_count = len(x0)
+        edge_ids = np.concatenate([np.arange(edge_count), np.arange(edge_count), edge_ids_x, edge_ids_y])
+        t = np.clip(np.concatenate([np.zeros(edge_count), np.ones(edge_count), t_x, t_y]), 0.0, 1.0)
+        order = np.lexsort((t, edge_ids))
+        edge_ids, t = edge_ids[order], t[order]
+
+        # 隣り合う分割点の間が、1つのセル内に収まる辺の断片となる
+        is_piece = (edge_ids[:-1] == edge_ids[1:]) & (t[1:] > t[:-1])
+        piece_edges, t_start, t_end = edge_ids[:-1][is_piece], t[:-1][is_piece], t[1:][is_piece]
+        px0 = x0[piece_edges] + t_start * dx[piece_edges]
+        px1 = x0[piece_edges] + t_end * dx[piece_edges]
+        py_mid = y0[piece_edges] + (t_start + t_end) / 2 * dy[piece_edges]
+        piece_dx = (px1 - px0) * edge_sign[piece_edges]
+        piece_geoms = edge_geom[piece_edges]
+
+        piece_cols = np.floor(((px0 + px1) / 2 - grid_offset_x) / cs).astype(np.int64)
+        piece_rows = np.floor((py_mid - grid_offset_y) / cs).astype(np.int64)
+        in_cols = (piece_cols >= 0) & (piece_cols < grid_cols)
+        piece_cols, piece_rows, piece_dx, py_mid, piece_geoms = piece_cols[in_cols], piece_rows[in_cols], piece_dx[in_cols], py_mid[in_cols], piece_geoms[in_cols]
+
+        # 断片を含むセル: 断片とセル上端の間の台形面積
+        in_rows = (piece_rows >= 0) & (piece_rows < grid_rows)
+        partial = np.bincount(
+            (piece_geoms[in_rows] * grid_rows + piece_rows[in_rows]) * grid_cols + piece_cols[in_rows],
+            weights=piece_dx[in_rows] * (py_mid[in_rows] - (grid_offset_y + piece_rows[in_rows] * cs)),
+            minlength=geom_count * grid_rows * grid_cols
+        ).reshape(geom_count, grid_rows, grid_cols)
+
+        # 断片より上側のセル: セル全高ぶんの寄与 (差分配列を下から累積する)
+        has_rows_above = piece_rows > 0
+        rows_above = np.minimum(piece_rows[has_rows_above], grid_rows)
+        full = np.bincount(
+            (piece_geoms[has_rows_above] * (grid_rows + 1) + rows_above) * grid_cols + piece_cols[has_rows_above],
+            weights=piece_dx[has_rows_above] * cs,
+            minlength=geom_count * (grid_rows + 1) * grid_cols
+        ).reshape(geom_count, grid_rows + 1, grid_cols)
+        full = np.cumsum(full[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+        coverage = (partial + full) / (cs ** 2)
+        # 浮動小数点誤差を丸め、ちょうど50%のセルが閾値の前後に揺れないようにする
+        return np.clip(np.round(coverage, 12), 0.0, 1.0)
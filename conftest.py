@@ -0,0 +1 @@
+# tests/ からリポジトリ直下のモジュールを import できるよう、pytest にルートを認識させる
@@ -0,0 +1,71 @@
+#--- START OF FILE feature_table.py ---
+import fiona
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+
+class FeatureTable:
+    """
+    レイヤの地物を列ごとに保持する表。fionaの地物(座標の入れ子タプルと属性の辞書)は保持しない。
+      ids    : 地物ID (読み込み元の id をそのまま保持)
+      geoms  : shapely ジオメトリの配列 (ジオメトリがない・空・解析できない地物は None)
+      スタイル属性 (STYLE_FIELDS) : 値の種類ごとの辞書エンコード (値の一覧 + int32 のコード列)
+    その他の属性は保持せず、get_properties() で読み込み元のファイルから必要な地物の分だけ読み直す。
+    """
+    STYLE_FIELDS = ('fill_color', 'strk_color', 'strk_width', 'strk_style', 'meter')
+
+    def __init__(self, ids, geoms, style_columns, source=None):
+        self.ids = ids
+        self.geoms = geoms
+        self._style_columns = style_columns
+        # (ファイルパス, レイヤ名, 文字コード)。None の場合はスタイル属性以外を読み直せない
+        self.source = source
+
+    @classmethod
+    def from_features(cls, features, source=None):
+        """fionaの地物(または同じ形の辞書)を1件ずつ列に振り分けて表を作る。features はイテレータでもよい"""
+        ids, geoms = [], []
+        codes = {name: [] for name in cls.STYLE_FIELDS}
+        categories = {name: {} for name in cls.STYLE_FIELDS}
+        for feature in features:
+            ids.append(feature.get('id'))
+            geom = None
+            geom_dict = feature.get('geometry')
+            if geom_dict:
+                try:
+                    geom = shape(geom_dict)
+                except Exception:
+                    geom = None
+            geoms.append(geom)
+            props = feature.get('properties') or {}
+            for name in cls.STYLE_FIELDS:
+                value = props.get(name)
+                codes[name].append(categories[name].setdefault(value, len(categories[name])))
+
+        geom_array = np.empty(len(geoms), dtype=object)
+        geom_array[:] = geoms
+        geom_array[shapely.is_empty(geom_array)] = None
+        id_array = np.empty(len(ids), dtype=object)
+        id_array[:] = ids
+        style_columns = {name: (list(categories[name]), np.array(codes[name], dtype=np.int32)) for name in cls.STYLE_FIELDS}
+        return cls(id_array, geom_array, style_columns, source)
+
+    def __len__(self):
+        return len(self.geoms)
+
+    def get_style_value(self, name, index):
+        values, codes = self._style_columns[name]
+        return values[codes[index]]
+
+    def get_style_properties(self, index):
+        """地物の描画に使う属性 (STYLE_FIELDS のうち値のあるもの) の辞書"""
+        return {name: value for name in self.STYLE_FIELDS if (value := self.get_style_value(name, index)) is not None}
+
+    def get_properties(self, index):
+        """地物の全属性の辞書。スタイル属性以外は読み込み元のファイルから読み直す"""
+        if self.source is None or self.ids[index] is None:
+            return self.get_style_properties(index)
+        path, layer_name, encoding = self.source
+        with fiona.open(path, 'r', layer=layer_name, encoding=encoding) as c:
+            return dict(c[int(self.ids[index])]['properties'])
@@ -0,0 +1,73 @@
+#--- START OF FILE geometry_store.py ---
+import numpy as np
+import shapely
+
+
+class LayerGeometryStore:
+    """
+    レイヤの地物ジオメトリから、描画・計算で使う派生データを読み込み時に一度だけ作成して保持する。
+    いずれの配列も地物と同じ順序で、ジオメトリがない(空・解析不能な)地物は None となる。
+      geoms    : 読み込んだままのジオメトリ (FeatureTable.geoms と同じ配列。描画・スナップ用)
+      repaired : 無効なジオメトリを buffer(0) で修復したもの (計算・範囲算出用)
+      bounds   : repaired の外接矩形 (N x 4、ジオメトリがない地物は NaN)
+    total_bounds はレイヤ全体の外接矩形 (ジオメトリがなければ全て NaN)、
+    convex_hull はレイヤ全体の凸包 (ジオメトリがなければ None)。
+    画面描画用の単純化ジオメトリは get_simplified_geoms で必要な地物の分だけ作成する。
+    """
+    def __init__(self, geoms):
+        self.geoms = geoms
+
+        self.repaired = self.geoms.copy()
+        is_invalid = shapely.is_geometry(self.geoms) & ~shapely.is_valid(self.geoms)
+        for i in np.flatnonzero(is_invalid):
+            try:
+                repaired_geom = self.geoms[i].buffer(0)
+                self.repaired[i] = None if repaired_geom.is_empty else repaired_geom
+            except Exception:
+                self.repaired[i] = None
+        self.bounds = shapely.bounds(self.repaired)
+        self.total_bounds = shapely.total_bounds(self.repaired) if len(self.repaired) > 0 else np.full(4, np.nan)
+        coords = shapely.get_coordinates(self.repaired)
+        self.convex_hull = shapely.convex_hull(shapely.multipoints(coords)) if len(coords) > 0 else None
+        self._simplified = {}
+        self._tree = None
+
+    def __len__(self):
+        return len(self.geoms)
+
+    def get_geoms(self):
+        """ジオメトリのある地物の、読み込んだままのジオメトリ配列"""
+        return self.geoms[shapely.is_geometry(self.geoms)]
+
+    def get_repaired_geoms(self):
+        """ジオメトリのある地物の、修復済みジオメトリ配列"""
+        return self.repaired[shapely.is_geometry(self.repaired)]
+
+    def get_tree(self):
+        """geoms の STRtree (初回に作成して保持する)。検索結果の番号は地物の番号と一致する"""
+        if self._tree is None:
+            self._tree = shapely.STRtree(self.geoms)
+        return self._tree
+
+    def get_simplified_geoms(self, tolerance, indices):
+        """
+        indices の地物の geoms を位相を保ったまま許容値 tolerance で単純化した配列 (画面描画の詳細度切り替え用)。
+        結果は許容値ごとに保持し、まだ単純化していない地物だけを計算する。
+        """
+        if tolerance not in self._simplified:
+            self._simplified[tolerance] = (np.full(len(self.geoms), None, dtype=object), np.zeros(len(self.geoms), dtype=bool))
+        simplified, is_done = self._simplified[tolerance]
+        missing = indices[~is_done[indices]]
+        if len(missing) > 0:
+            simplified[missing] = shapely.simplify(self.geoms[missing], tolerance, preserve_topology=True)
+            is_done[missing] = True
+        return simplified[indices]
+
+
+def get_geometry_store(layer_info):
+    """レイヤのジオメトリストアを返す。まだ作成されていなければ地物表のジオメトリから作成して保持する"""
+    store = layer_info.get('geometry_store')
+    if store is None or store.geoms is not layer_info['features'].geoms:
+        store = LayerGeometryStore(layer_info['features'].geoms)
+        layer_info['geometry_store'] = store
+    return store
@@ -0,0 +1,153 @@
+#--- START OF FILE grid_transform.py ---
+import math
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+
+class GridTransform:
+    """
+    ワールド座標(平面直角座標)とシーン座標(グリッドの描画座標)の相互変換。
+    Qtに依存しないため、画面を持たない計算やワーカープロセスからも利用できる。
+    回転・縮尺・平行移動は1つのアフィン行列にまとめ、レイアウトが変わるまで再計算しない。
+    """
+    def __init__(self, project, grid_offset_x=0, grid_offset_y=0):
+        self.project = project
+        self.grid_offset_x, self.grid_offset_y = grid_offset_x, grid_offset_y
+        # (状態キー, パラメータ, 行列, 逆行列)。分割計算のスレッドから同時に参照されても
+        # 古いキーと新しい行列が混ざらないよう、1つのタプルとしてまとめて置き換える
+        self._state = (None, None, None, None)
+
+    def _get_state_key(self):
+        """変換結果を左右するプロジェクトの設定値の組"""
+        p = self.project
+        return (
+            tuple(p.master_bbox) if p.master_bbox else None, p.map_rotation, p.map_offset_x, p.map_offset_y,
+            p.grid_rows, p.grid_cols, p.cell_size_on_screen, p.k_value,
+            self.grid_offset_x, self.grid_offset_y
+        )
+
+    def _update(self):
+        """現在の設定に対応する (状態キー, パラメータ, 行列, 逆行列) を返す。設定が変わっていれば計算し直す"""
+        state = self._state
+        state_key = self._get_state_key()
+        if state_key == state[0]: return state
+        params = self._compute_parameters()
+        state = (state_key, params, *self._compute_matrices(params))
+        self._state = state
+        return state
+
+    def _compute_parameters(self):
+        p = self.project
+        if not p.master_bbox: return None
+        rotated_corners = self.rotate_coords([(p.master_bbox[0], p.master_bbox[1]), (p.master_bbox[2], p.master_bbox[3]), (p.master_bbox[2], p.master_bbox[1]), (p.master_bbox[0], p.master_bbox[3])])
+        xs, ys = [c[0] for c in rotated_corners], [c[1] for c in rotated_corners]
+        bbox_to_use, scale = (min(xs), min(ys), max(xs), max(ys)), p.cell_size_on_screen / p.k_value
+        center_x, center_y = bbox_to_use[0] + (bbox_to_use[2] - bbox_to_use[0])/2, bbox_to_use[1] + (bbox_to_use[3] - bbox_to_use[1])/2
+        grid_center_x, grid_center_y = self.grid_offset_x + (p.grid_cols*p.cell_size_on_screen)/2, self.grid_offset_y + (p.grid_rows*p.cell_size_on_screen)/2
+
+        # パン操作のオフセットは、画面表示とPDF出力の両方で適用する
+        grid_center_x += p.map_offset_x
+        grid_center_y += p.map_offset_y
+
+        return {'scale': scale, 'center_x': center_x, 'center_y': center_y, 'grid_center_x': grid_center_x, 'grid_center_y': grid_center_y}
+
+    def _compute_matrices(self, params):
+        """
+        ワールド→シーンの変換 (地図中心周りの回転 → 縮尺 → Y軸反転・平行移動) を
+        shapely.affinity.affine_transform 形式の [a, b, d, e, xoff, yoff] にまとめ、逆行列も求める。
+        """
+        if not params: return None, None
+        p = self.project
+        orig_center_x, orig_center_y = p.master_bbox[0] + (p.master_bbox[2]-p.master_bbox[0])/2, p.master_bbox[1] + (p.master_bbox[3]-p.master_bbox[1])/2
+        theta = math.radians(p.map_rotation)
+        cos_theta, sin_theta = math.cos(theta), math.sin(theta)
+        rotation = np.array([
+            [cos_theta, -sin_theta, orig_center_x - orig_center_x*cos_theta + orig_center_y*sin_theta],
+            [sin_theta, cos_theta, orig_center_y - orig_center_x*sin_theta - orig_center_y*cos_theta],
+            [0.0, 0.0, 1.0]
+        ])
+        scale = params['scale']
+        to_scene = np.array([
+            [scale, 0.0, params['grid_center_x'] - params['center_x']*scale],
+            [0.0, -scale, params['grid_center_y'] + params['center_y']*scale],
+            [0.0, 0.0, 1.0]
+        ])
+        forward = to_scene @ rotation
+        inverse = np.linalg.inv(forward)
+        as_affine = lambda m: [m[0, 0], m[0, 1], m[1, 0], m[1, 1], m[0, 2], m[1, 2]]
+        return as_affine(forward), as_affine(inverse)
+
+    def get_parameters(self):
+        return self._update()[1]
+
+    @property
+    def matrix(self):
+        """ワールド→シーンのアフィン行列 [a, b, d, e, xoff, yoff]。bboxが未確定の場合は None"""
+        return self._update()[2]
+
+    @property
+    def inverse_matrix(self):
+        """シーン→ワールドのアフィン行列 [a, b, d, e, xoff, yoff]。bboxが未確定の場合は None"""
+        return self._update()[3]
+
+    def rotate_coords(self, coords, inverse=False):
+        """座標列を地図中心周りに map_rotation 度 (inverse=True で逆方向に) 回転する"""
+        p = self.project
+        if p.map_rotation == 0 or not p.master_bbox: return coords
+        orig_center_x, orig_center_y = p.master_bbox[0] + (p.master_bbox[2]-p.master_bbox[0])/2, p.master_bbox[1] + (p.master_bbox[3]-p.master_bbox[1])/2
+        theta = math.radians(-p.map_rotation if inverse else p.map_rotation)
+        cos_theta, sin_theta = math.cos(theta), math.sin(theta)
+        return [((p_x-orig_center_x)*cos_theta - (p_y-orig_center_y)*sin_theta + orig_center_x, (p_x-orig_center_x)*sin_theta + (p_y-orig_center_y)*cos_theta + orig_center_y) for p_x, p_y in coords]
+
+    def transform_coords(self, coords, inverse=False):
+        """座標列 (N x 2) をシーン座標 (inverse=True でワールド座標) に変換した配列を返す"""
+        m = self.inverse_matrix if inverse else self.matrix
+        if m is None: return None
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        return np.column_stack([m[0]*coords[:, 0] + m[1]*coords[:, 1] + m[4], m[2]*coords[:, 0] + m[3]*coords[:, 1] + m[5]])
+
+    def world_to_scene(self, x, y):
+        m = self.matrix
+        if m is None: return None
+        return (m[0]*x + m[1]*y + m[4], m[2]*x + m[3]*y + m[5])
+
+    def scene_to_world(self, x, y):
+        m = self.inverse_matrix
+        if m is None: return None
+        return (m[0]*x + m[1]*y + m[4], m[2]*x + m[3]*y + m[5])
+
+    def transform_geoms(self, geoms, inverse=False):
+        """
+        ジオメトリ(または配列)の全座標をアフィン行列で一括変換する。
+        GeometryCollection や MultiPoint を含む全てのジオメトリ型に対応する。
+        """
+        m = self.inverse_matrix if inverse else self.matrix
+        if m is None or geoms is None: return None
+        linear = np.array([[m[0], m[2]], [m[1], m[3]]])
+        offset = np.array([m[4], m[5]])
+        return shapely.transform(geoms, lambda coords: coords @ linear + offset)
+
+    def world_geom_to_scene_geom(self, world_geom):
+        try:
+            return self.transform_geoms(world_geom)
+        except Exception as e:
+            print(f"シーンジオメトリ変換エラー: {e}")
+            return None
+
+    def scene_geom_to_world_geom(self, scene_geom):
+        try:
+            return self.transform_geoms(scene_geom, inverse=True)
+        except Exception as e:
+            print(f"ワールドジオメトリ変換エラー: {e}")
+            return None
+
+    def get_cell_scene_polygon(self, row, col):
+        cs = self.project.cell_size_on_screen
+        scene_x1 = self.grid_offset_x + col * cs
+        scene_y1 = self.grid_offset_y + row * cs
+        return box(scene_x1, scene_y1, scene_x1 + cs, scene_y1 + cs)
+
+    def get_cell_world_polygon(self, row, col):
+        return self.scene_geom_to_world_geom(self.get_cell_scene_polygon(row, col))
@@ -0,0 +1,179 @@
+#--- START OF FILE layer_loader.py ---
+import itertools
+import logging
+import threading
+
+import fiona
+from fiona.errors import FionaError
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from shapely.geometry import shape, mapping
+from shapely.ops import unary_union
+
+from feature_table import FeatureTable
+from geometry_store import LayerGeometryStore
+
+# 属性条件の項目がレイヤにない場合の GDAL のエラー (GeoPackage/SQLite と OGR SQL)
+_MISSING_FIELD_MESSAGES = ('no such column', 'not recognised as an available field')
+
+
+class _GdalErrorLog(logging.Handler):
+    """
+    with の間に、このスレッドで GDAL が出したエラーを記録する。
+    GeoPackage では項目がないことを示すエラーが例外のメッセージに含まれず、fiona のログにだけ出るため。
+    """
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+        self._thread_id = threading.get_ident()
+
+    def emit(self, record):
+        if record.thread == self._thread_id:
+            self.messages.append(record.getMessage())
+
+    def __enter__(self):
+        logging.getLogger('fiona._env').addHandler(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        logging.getLogger('fiona._env').removeHandler(self)
+
+    def is_missing_field_error(self, error):
+        text = ' '.join([str(error), *self.messages]).lower()
+        return any(message in text for message in _MISSING_FIELD_MESSAGES)
+
+
+class LayerLoadSignals(QObject):
+    progress = pyqtSignal(object)   # (タスク) 読み込み件数が進んだ
+    finished = pyqtSignal(object)   # (タスク) 全レイヤの読み込みが終わった (結果は task.results)
+    cancelled = pyqtSignal(object)  # (タスク) 中止された
+
+
+class LayerLoadTask(QRunnable):
+    """
+    1つのファイルから指定されたレイヤを読み込むワーカー (QThreadPool で実行する)。
+    地物を CHUNK_SIZE 件ずつ読み進めて進捗を通知しながら地物表 (FeatureTable) に振り分け、
+    ジオメトリの検証 (ジオメトリストアと空間インデックスの作成) まで済ませてから、結果をシグナルでメインスレッドへ渡す。
+    cancel() を呼ぶと、次のチャンクの区切りで読み込みを中止する。
+    read_filter を指定すると、条件に合う地物だけを読み込む (fiona の filter を使用):
+      where  : 属性条件 (SQLのWHERE句)
+      bbox   : 範囲 (xmin, ymin, xmax, ymax)
+      buffer : 0より大きい場合、where に一致した地物をこの距離 (m) だけ広げた範囲を mask として、
+               選択した全レイヤからその範囲に掛かる地物 (対象の区域とその周辺) を読み込む
+    task.results はレイヤごとの辞書のリストで、読み込めたレイヤは
+    layer_name / features / geom_type / crs / geometry_store を、失敗したレイヤは layer_name / error を持つ。
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, file_path, layer_names, read_filter=None):
+        super().__init__()
+        # 結果はメインスレッドが task から受け取るため、実行後もオブジェクトを残す
+        self.setAutoDelete(False)
+        self.file_path = file_path
+        self.layer_names = list(layer_names)
+        self.read_filter = read_filter
+        self.signals = LayerLoadSignals()
+        self.results = []
+        self.loaded_count, self.total_count = 0, 0
+        self.is_finished = False
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        open_path = f"zip://{self.file_path}" if self.file_path.lower().endswith('.zip') else self.file_path
+        try:
+            filter_kwargs = self._get_filter_kwargs(open_path) if self.read_filter else {}
+        except Exception as e:
+            # 絞り込みの条件が使えない場合は、どのレイヤも読み込まずにエラーを1件だけ返す
+            self.results.append({'layer_name': ', '.join(map(str, self.layer_names)), 'error': e})
+            self._finish()
+            return
+        # 絞り込み時は件数を事前に数えられないため、進捗は件数なし (0) で表示する
+        if not filter_kwargs:
+            self.total_count = sum(self._count_features(open_path, layer_name) for layer_name in self.layer_names)
+        self.signals.progress.emit(self)
+
+        for layer_name in self.layer_names:
+            if self.is_cancelled(): break
+            loaded_before = self.loaded_count
+            try:
+                try:
+                    layer_data = self._read_layer(open_path, layer_name, 'utf-8', loaded_before, filter_kwargs)
+                except (FionaError, UnicodeDecodeError):
+                    layer_data = self._read_layer(open_path, layer_name, 'cp932', loaded_before, filter_kwargs)
+            except Exception as e:
+                self.results.append({'layer_name': layer_name, 'error': e})
+                continue
+            if layer_data is not None:
+                self.results.append(layer_data)
+        self._finish()
+
+    def _finish(self):
+        self.is_finished = True
+        if self.is_cancelled():
+            self.signals.cancelled.emit(self)
+        else:
+            self.signals.finished.emit(self)
+
+    def _count_features(self, open_path, layer_name):
+        """進捗表示用の地物数 (数えられない場合は 0)"""
+        try:
+            with fiona.open(open_path, 'r', layer=layer_name) as c:
+                return len(c)
+        except Exception:
+            return 0
+
+    def _get_filter_kwargs(self, open_path):
+        """read_filter を fiona の Collection.filter に渡す引数に変換する"""
+        where, bbox, buffer = self.read_filter.get('where'), self.read_filter.get('bbox'), self.read_filter.get('buffer', 0)
+        if where and buffer > 0:
+            # 条件に一致する地物を各レイヤから探して範囲を決める。
+            # 条件の項目を持たないレイヤは飛ばすが、条件の誤りなどそれ以外のエラーはそのまま知らせる
+            matched_geoms, queried_layers = [], 0
+            for layer_name in self.layer_names:
+                with fiona.open(open_path, 'r', layer=layer_name) as c, _GdalErrorLog() as error_log:
+                    try:
+                        matched = c.filter(where=where, bbox=bbox) if bbox else c.filter(where=where)
+                        matched_geoms.extend(shape(f['geometry']) for f in matched if f['geometry'])
+                    except Exception as e:
+                        if error_log.is_missing_field_error(e): continue
+                        raise
+                queried_layers += 1
+            if queried_layers == 0:
+                raise ValueError(f"条件 '{where}' の項目を持つレイヤがありません。")
+            if not matched_geoms:
+                raise ValueError(f"条件 '{where}' に一致する地物が見つかりませんでした。")
+            return {'mask': mapping(unary_union(matched_geoms).buffer(buffer))}
+        filter_kwargs = {}
+        if where: filter_kwargs['where'] = where
+        if bbox: filter_kwargs['bbox'] = tuple(bbox)
+        return filter_kwargs
+
+    def _read_layer(self, open_path, layer_name, encoding, loaded_before, filter_kwargs):
+        """1レイヤを地物表に読み込んでジオメトリストアまで作成する。中止された場合は None"""
+        with fiona.open(open_path, 'r', layer=layer_name, encoding=encoding) as c:
+            geom_type, crs = c.schema.get('geometry', 'Unknown'), c.crs
+            source_features = c.filter(**filter_kwargs) if filter_kwargs else c
+            features = FeatureTable.from_features(self._iter_features(source_features, loaded_before), source=(open_path, layer_name, encoding))
+        if self.is_cancelled(): return None
+
+        geometry_store = LayerGeometryStore(features.geoms)
+        geometry_store.get_tree()
+        return {'layer_name': layer_name, 'features': features, 'geom_type': geom_type, 'crs': crs, 'geometry_store': geometry_store,
+                'is_filtered': bool(filter_kwargs)}
+
+    def _iter_features(self, collection, loaded_before):
+        """地物を CHUNK_SIZE 件ずつ読み進め、チャンクごとに進捗を通知する。中止されたらそこで終わる"""
+        feature_iter = iter(collection)
+        loaded = 0
+        while not self.is_cancelled():
+            chunk = list(itertools.islice(feature_iter, self.CHUNK_SIZE))
+            if not chunk: break
+            yield from chunk
+            loaded += len(chunk)
+            self.loaded_count = loaded_before + loaded
+            self.signals.progress.emit(self)
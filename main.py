@@ -13,9 +13,9 @@ from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QFileDialog, QMessageBox, QWidget,
     QVBoxLayout, QHBoxLayout, QLabel, QListWidgetItem, QFrame, QLineEdit, QGraphicsScene,
-    QInputDialog, QComboBox, QCheckBox
+    QInputDialog, QComboBox, QCheckBox, QProgressBar
 )
-from PyQt6.QtCore import Qt, QRectF, QMarginsF, QPointF, QSize, QPoint, QSizeF, QBuffer
+from PyQt6.QtCore import Qt, QRectF, QMarginsF, QPointF, QSize, QPoint, QSizeF, QBuffer, QThreadPool
 from PyQt6.QtGui import QFont, QColor, QPainter, QPageLayout, QPageSize, QPdfWriter, QPen
 from PyQt6.QtPrintSupport import QPrinter
 
@@ -23,6 +23,7 @@ from app_state import AppState
 from project import Project
 from renderer import MapRenderer
 from calculator import Calculator
+from layer_loader import LayerLoadTask
 from ui_components import LayerSelectionDialog, DroppableListWidget, MyGraphicsView, TextAnnotationDialog
 from report_generator import ReportGenerator
 
@@ -34,10 +35,16 @@ class X_Grid(QMainWindow):
         self.project = Project()
         self.scene = QGraphicsScene(self)
         self.renderer = MapRenderer(self.scene, self.project)
-        self.calculator = Calculator(self.project, self.renderer)
+        self.calculator = Calculator(self.project, self.renderer.transform)
         self.project.calculator = self.calculator
         self.previous_app_state = AppState.IDLE
         self.report_generator = ReportGenerator()
+        # 土場指定中のマウス移動で平均集材距離を即時表示するための事前計算結果
+        self.landing_preview = None
+        # バックグラウンドで読み込み中のレイヤ (読み込みを開始した順。結果もこの順にレイヤへ追加する)
+        self.thread_pool = QThreadPool.globalInstance()
+        self.layer_load_tasks = []
+        self._layers_added_during_load = False
         self.init_ui()
         self.renderer.draw_grid()
         self._update_ui_for_state(AppState.IDLE)
@@ -106,10 +113,15 @@ class X_Grid(QMainWindow):
         self.start_split_button = QPushButton("② 区域を分割して計算")
         self.start_split_button.setStyleSheet("font-size: 11pt; padding: 8px;")
         self.snap_checkbox = QCheckBox("スナップ")
+        self.snap_mode_combo = QComboBox()
+        self.snap_mode_combo.addItem("線", "edge")
+        self.snap_mode_combo.addItem("頂点", "vertex")
+        self.snap_mode_combo.setToolTip("線: 線上の最も近い点にスナップ\n頂点: 頂点・交点を優先してスナップ (近くになければ線上)")
         self.trace_checkbox = QCheckBox("トレース")
         split_button_layout.addWidget(self.start_split_button)
         split_button_layout.addSpacing(10)
         split_button_layout.addWidget(self.snap_checkbox)
+        split_button_layout.addWidget(self.snap_mode_combo)
         split_button_layout.addWidget(self.trace_checkbox)
         split_button_layout.addStretch(1)
 
@@ -130,9 +142,19 @@ class X_Grid(QMainWindow):
         layer_buttons_layout.addWidget(self.layer_up_button)
         layer_buttons_layout.addWidget(self.layer_down_button)
 
+        layer_load_layout = QHBoxLayout()
+        self.layer_load_progress_bar = QProgressBar()
+        self.layer_load_progress_bar.setFormat("読み込み中... %v / %m 地物")
+        self.cancel_layer_load_button = QPushButton("中止")
+        layer_load_layout.addWidget(self.layer_load_progress_bar, 1)
+        layer_load_layout.addWidget(self.cancel_layer_load_button)
+        self.layer_load_progress_bar.setVisible(False)
+        self.cancel_layer_load_button.setVisible(False)
+
         left_panel_layout.addWidget(layer_management_label)
         left_panel_layout.addWidget(self.layer_list_widget)
         left_panel_layout.addLayout(layer_buttons_layout)
+        left_panel_layout.addLayout(layer_load_layout)
         
         left_panel_layout.addLayout(settings_button_layout)
         
@@ -174,6 +196,11 @@ class X_Grid(QMainWindow):
         self.area_label = QLabel("面積: - ha")
         self.area_label.setStyleSheet("font-weight: bold; font-size: 10pt; margin-right: 5px;")
         action_panel.addWidget(self.area_label)
+
+        self.landing_preview_label = QLabel()
+        self.landing_preview_label.setStyleSheet("font-weight: bold; font-size: 10pt; color: #006400; margin-right: 5px;")
+        self.landing_preview_label.setVisible(False)
+        action_panel.addWidget(self.landing_preview_label)
         action_panel.addStretch(1)
 
         action_panel.addWidget(self.display_mode_combo)
@@ -238,6 +265,7 @@ class X_Grid(QMainWindow):
         self.clear_settings_button.clicked.connect(self.clear_all_calculation_settings)
         
         self.snap_checkbox.toggled.connect(self._on_snap_toggled)
+        self.snap_mode_combo.currentIndexChanged.connect(self._on_snap_mode_changed)
         self.trace_checkbox.toggled.connect(self._on_trace_toggled)
 
         self.calculate_button.clicked.connect(self.run_calculation_and_draw); 
@@ -245,6 +273,7 @@ class X_Grid(QMainWindow):
         self.export_button.clicked.connect(self.export_results)
         self.subtitle_input.returnPressed.connect(self.update_title_display)
         self.view.sceneClicked.connect(self.on_scene_clicked)
+        self.view.sceneMouseMoved.connect(self.on_scene_mouse_moved)
         self.view.sceneRightClicked.connect(self.on_scene_right_clicked)
         self.display_mode_combo.currentIndexChanged.connect(self.on_display_mode_changed)
         
@@ -253,15 +282,25 @@ class X_Grid(QMainWindow):
         self.view.editAnnotationPropertiesRequested.connect(self.edit_text_annotation_properties)
         self.remove_all_annotations_button.clicked.connect(self.remove_all_text_annotations)
         self.view.backspacePressed.connect(self._handle_backspace_press)
+        self.view.viewZoomed.connect(self._on_view_zoomed)
+        self.cancel_layer_load_button.clicked.connect(self.cancel_layer_loading)
         
         self._update_ui_for_state(AppState.IDLE)
 
+    def _on_view_zoomed(self):
+        # 拡大率に応じて画面表示に使う簡略化ジオメトリの段階を切り替える
+        self.renderer.set_view_zoom(self.view.transform().m11())
+
     def _on_snap_toggled(self, checked):
         self.project.snapping_enabled = checked
         if not checked:
             self.trace_checkbox.setChecked(False)
             self.project.tracing_enabled = False
         self.trace_checkbox.setEnabled(checked)
+        self.snap_mode_combo.setEnabled(checked)
+
+    def _on_snap_mode_changed(self, index):
+        self.project.snap_mode = self.snap_mode_combo.itemData(index)
 
     def _on_trace_toggled(self, checked):
         if checked and not self.project.snapping_enabled:
@@ -275,8 +314,8 @@ class X_Grid(QMainWindow):
         self.guide_content_label.setText(rich_text)
 
     def update_area_display(self):
-        in_area_cells = self.calculator.get_in_area_cells()
-        cell_count = len(in_area_cells)
+        coverage = self.calculator.get_in_area_coverage()
+        cell_count = int((coverage >= self.calculator.AREA_RATIO_THRESHOLD).sum())
         if cell_count > 0:
             area_ha = cell_count * (self.project.k_value ** 2) / 10000
             self.area_label.setText(f"面積: {area_ha:.2f} ha ({cell_count}セル)")
@@ -300,9 +339,14 @@ class X_Grid(QMainWindow):
         is_interactive_mode = new_state in [AppState.AWAITING_LANDING_POINT, AppState.DRAWING_SPLIT_LINE, AppState.AWAITING_ANNOTATION_POINT]
         self.clear_settings_button.setEnabled(has_settings or is_interactive_mode)
         
+        if new_state != AppState.AWAITING_LANDING_POINT:
+            self.landing_preview = None
+            self.landing_preview_label.setVisible(False)
+
         is_drawing_split = new_state == AppState.DRAWING_SPLIT_LINE
         self.snap_checkbox.setEnabled(is_drawing_split)
         self.trace_checkbox.setEnabled(is_drawing_split and self.snap_checkbox.isChecked())
+        self.snap_mode_combo.setEnabled(is_drawing_split and self.snap_checkbox.isChecked())
         if not is_drawing_split:
             self.snap_checkbox.setChecked(False)
             self.trace_checkbox.setChecked(False)
@@ -411,6 +455,72 @@ class X_Grid(QMainWindow):
             self.project.sub_area_data[area_index]['calc_mode'] = mode
         
         self._update_ui_for_state(AppState.AWAITING_LANDING_POINT)
+        self._prepare_landing_preview()
+        self._show_landing_suggestion(guide_text)
+
+    def _invalidate_coverage_cache(self):
+        """被覆率キャッシュと、それをもとに事前計算した土場のプレビュー・候補表示を破棄する"""
+        self.calculator.invalidate_coverage_cache()
+        self._clear_landing_preview()
+
+    def _clear_landing_preview(self):
+        self.landing_preview = None
+        self.landing_preview_label.setVisible(False)
+        self.renderer.clear_landing_suggestion()
+
+    def _get_configuring_target(self):
+        """設定中の区域の計算方法と対象ジオメトリを返す"""
+        area_index = self.project.configuring_area_index
+        if area_index is None:
+            return self.project.default_calc_mode, self.project._get_combined_calculable_geom()
+        area_data = self.project.sub_area_data[area_index]
+        return area_data['calc_mode'], area_data['geom']
+
+    def _prepare_landing_preview(self):
+        """
+        全セルを土場とした場合の平均集材距離と、指定可能なセルを事前に計算しておく。
+        マウス移動時は配列を参照するだけで、ジオメトリ処理は行わない。
+        """
+        calc_mode, target_geom = self._get_configuring_target()
+        coverage = self.calculator.get_coverage_for_geom(target_geom)
+        distance_grid = self.calculator.get_landing_distance_grid(coverage)
+        if distance_grid is None:
+            self.landing_preview = None
+            return
+
+        valid_mask = self.calculator.get_landing_cell_mask(target_geom, calc_mode)
+        self.landing_preview = {'calc_mode': calc_mode, 'distance_grid': distance_grid, 'valid_mask': valid_mask}
+        self.landing_preview_label.setText("平均集材距離: -")
+        self.landing_preview_label.setVisible(True)
+
+    def on_scene_mouse_moved(self, scene_pos):
+        preview = self.landing_preview
+        if preview is None or self.project.app_state != AppState.AWAITING_LANDING_POINT:
+            return
+
+        cs = self.project.cell_size_on_screen
+        col = math.floor((scene_pos.x() - self.renderer.grid_offset_x) / cs)
+        row = math.floor((scene_pos.y() - self.renderer.grid_offset_y) / cs)
+        if not (0 <= row < self.project.grid_rows and 0 <= col < self.project.grid_cols) or not preview['valid_mask'][row, col]:
+            self.landing_preview_label.setText("平均集材距離: -")
+            return
+
+        distance = preview['distance_grid'][row, col]
+        suffix = " + L" if preview['calc_mode'] == 'external' else ""
+        self.landing_preview_label.setText(f"平均集材距離: {distance:.1f} m{suffix}")
+
+    def _show_landing_suggestion(self, guide_text):
+        """平均集材距離が最小となる土場(入口)の候補を地図上とガイドに表示する"""
+        calc_mode, target_geom = self._get_configuring_target()
+        landing_cell, distance = self.calculator.find_optimal_landing(target_geom, calc_mode)
+        if landing_cell is None:
+            return
+        self.renderer.draw_landing_suggestion(landing_cell)
+        distance_text = f"約 {distance:.0f} m" if calc_mode == 'internal' else f"約 {distance:.0f} m + L"
+        self._set_guide_text(
+            f"{guide_text}"
+            f"<br><br><small>※ 緑の破線の円は、平均集材距離が最小となる位置です ({distance_text})。</small>"
+        )
 
     def _get_external_distance(self):
         area_index = self.project.configuring_area_index
@@ -465,6 +575,8 @@ class X_Grid(QMainWindow):
         for i in range(self.layer_list_widget.count()):
             list_item = self.layer_list_widget.item(i)
             is_checked = (list_item.checkState() == Qt.CheckState.Checked) if list_item.flags() & Qt.ItemFlag.ItemIsUserCheckable else False
+            if i < len(self.project.layers) and self.project.layers[i].get('is_calc_target') != is_checked:
+                self._invalidate_coverage_cache()
             self.project.set_calc_target_status(i, is_checked)
         self.update_layout_and_redraw()
         self._evaluate_and_set_readiness_state()
@@ -549,21 +661,17 @@ class X_Grid(QMainWindow):
                 col, row = int((scene_pos.x() - self.renderer.grid_offset_x) / self.project.cell_size_on_screen), int((scene_pos.y() - self.renderer.grid_offset_y) / self.project.cell_size_on_screen)
                 if 0 <= row < self.project.grid_rows and 0 <= col < self.project.grid_cols:
                     area_index = self.project.configuring_area_index
-                    
-                    if area_index is None:
-                        calc_mode = self.project.default_calc_mode
-                        target_geom = self.project._get_combined_calculable_geom()
-                    else:
-                        calc_mode = self.project.sub_area_data[area_index]['calc_mode']
-                        target_geom = self.project.sub_area_data[area_index]['geom']
+                    calc_mode, target_geom = self._get_configuring_target()
+                    # プレビューと同じ判定を使う (事前計算済みならその配列を参照する)
+                    preview = self.landing_preview
+                    valid_mask = preview['valid_mask'] if preview and preview['calc_mode'] == calc_mode else self.calculator.get_landing_cell_mask(target_geom, calc_mode)
+                    is_valid_click = bool(valid_mask[row, col])
 
                     if calc_mode == 'internal':
-                        is_valid_click = self.calculator.is_cell_in_area((row, col), target_geom)
                         if not is_valid_click:
                             QMessageBox.warning(self, "入力エラー", "土場は、計算対象ポリゴンと重なっているセルをクリックして指定してください。")
                             return
                     elif calc_mode == 'external':
-                        is_valid_click = self.renderer.is_cell_on_boundary(row, col, target_geom)
                         if not is_valid_click:
                             QMessageBox.warning(self, "入力エラー", "区域の入口は、対象区域の境界線上のセルをクリックしてください。")
                             return
@@ -573,6 +681,7 @@ class X_Grid(QMainWindow):
                     else:
                         self.project.sub_area_data[area_index]['landing_cell'] = (row, col)
                     
+                    self.renderer.clear_landing_suggestion()
                     self.renderer.draw_all_pointers()
 
                     if calc_mode == "internal":
@@ -599,6 +708,7 @@ class X_Grid(QMainWindow):
                 if len(world_points) > 1:
                     line = LineString(world_points)
                     self.project.split_lines.append(line)
+                    self._invalidate_coverage_cache()
 
             self.project.current_split_line_points = []
             self.renderer.clear_temporary_splitting_line()
@@ -614,6 +724,7 @@ class X_Grid(QMainWindow):
                 except Exception as e: 
                     QMessageBox.critical(self, "分割エラー", f"{e}")
                     self.project.reset_split_settings()
+                    self._invalidate_coverage_cache()
                     self.renderer.full_redraw()
                     self._update_ui_for_state(AppState.DRAWING_SPLIT_LINE)
             else: 
@@ -655,7 +766,7 @@ class X_Grid(QMainWindow):
              self._handle_file_addition(file_path)
 
     def _handle_file_addition(self, file_path):
-        layer_names_to_add = []
+        layer_names_to_add, read_filter = [], None
         try:
             if file_path.lower().endswith('.zip'):
                 layer_names_to_add = [name for name in fiona.listlayers(f"zip://{file_path}") if name.lower().endswith('.shp')]
@@ -669,35 +780,70 @@ class X_Grid(QMainWindow):
                 dialog = LayerSelectionDialog(all_layer_names, self)
                 if dialog.exec():
                     layer_names_to_add = dialog.get_selected_layers()
+                    read_filter = dialog.get_read_filter()
                 else:
                     return
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"ファイルからレイヤリストを取得できませんでした。\n\n詳細: {e}"); return
         if not layer_names_to_add: return
-        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-        try:
-            if self.add_layers_from_file(file_path, layer_names_to_add):
-                self.update_layout_and_redraw()
-        finally:
-            QApplication.restoreOverrideCursor()
+        self.start_layer_loading(file_path, layer_names_to_add, read_filter)
 
-    def add_layers_from_file(self, file_path, layer_names):
+    def start_layer_loading(self, file_path, layer_names, read_filter=None):
+        """
+        レイヤの読み込みをバックグラウンドで開始する。複数ファイルの読み込みは並行して進む。
+        read_filter (where / bbox / buffer) を指定すると条件に合う地物だけを読み込む (LayerLoadTask を参照)。
+        """
+        task = LayerLoadTask(file_path, layer_names, read_filter)
+        task.signals.progress.connect(self._on_layer_load_progress)
+        task.signals.finished.connect(self._on_layer_load_done)
+        task.signals.cancelled.connect(self._on_layer_load_done)
+        self.layer_load_tasks.append(task)
+        self._update_layer_load_progress()
+        self.thread_pool.start(task)
+
+    def cancel_layer_loading(self):
+        for task in self.layer_load_tasks:
+            task.cancel()
+
+    def _on_layer_load_progress(self, task):
+        self._update_layer_load_progress()
+
+    def _update_layer_load_progress(self):
+        is_loading = bool(self.layer_load_tasks)
+        self.layer_load_progress_bar.setVisible(is_loading)
+        self.cancel_layer_load_button.setVisible(is_loading)
+        if not is_loading: return
+        total = sum(task.total_count for task in self.layer_load_tasks)
+        if any(task.read_filter for task in self.layer_load_tasks):
+            # 絞り込み読み込みは全体の件数が分からないため、進行中の表示だけにする
+            self.layer_load_progress_bar.setRange(0, 0)
+            return
+        self.layer_load_progress_bar.setRange(0, max(total, 1))
+        self.layer_load_progress_bar.setValue(min(sum(task.loaded_count for task in self.layer_load_tasks), max(total, 1)))
+
+    def _on_layer_load_done(self, task):
+        # 読み込みを開始した順にレイヤへ追加するため、先頭から完了済みのものだけを取り出す
+        while self.layer_load_tasks and self.layer_load_tasks[0].is_finished:
+            finished_task = self.layer_load_tasks.pop(0)
+            if not finished_task.is_cancelled() and self.add_loaded_layers(finished_task.file_path, finished_task.results):
+                self._layers_added_during_load = True
+        self._update_layer_load_progress()
+        if not self.layer_load_tasks and self._layers_added_during_load:
+            self._layers_added_during_load = False
+            self.update_layout_and_redraw()
+
+    def add_loaded_layers(self, file_path, loaded_layers):
+        """LayerLoadTask が読み込んだレイヤをプロジェクトとレイヤ一覧に追加する"""
         new_layers_added = False
         self.layer_list_widget.blockSignals(True)
         
         is_zip = file_path.lower().endswith('.zip')
         
-        for layer_name in layer_names:
+        for loaded_layer in loaded_layers:
+            layer_name = loaded_layer['layer_name']
             try:
-                open_path = f"zip://{file_path}" if is_zip else file_path
-                
-                features, geom_type, crs = [], 'Unknown', None
-                try:
-                    with fiona.open(open_path, 'r', layer=layer_name, encoding='utf-8') as c:
-                        features, geom_type, crs = list(c), c.schema.get('geometry','Unknown'), c.crs
-                except (FionaError, UnicodeDecodeError):
-                    with fiona.open(open_path, 'r', layer=layer_name, encoding='cp932') as c:
-                        features, geom_type, crs = list(c), c.schema.get('geometry','Unknown'), c.crs
+                if 'error' in loaded_layer: raise loaded_layer['error']
+                features, geom_type, crs = loaded_layer['features'], loaded_layer['geom_type'], loaded_layer['crs']
                 
                 if not features: continue
                 if crs and crs.get('proj') == 'longlat':
@@ -715,8 +861,11 @@ class X_Grid(QMainWindow):
                 else:
                     internal_name = layer_name
                     item_text = f"{os.path.basename(file_path)} ({layer_name})"
+                if loaded_layer.get('is_filtered'):
+                    item_text += " [絞り込み]"
 
-                layer_info = {'path': file_path, 'layer_name': internal_name, 'geom_type': geom_type, 'features': features, 'graphics_items': [], 'is_calculable': is_calculable, 'is_calc_target': is_calculable}
+                # ジオメトリは読み込み時(ワーカー内)に一度だけ解析し、描画・計算で使い回す
+                layer_info = {'path': file_path, 'layer_name': internal_name, 'geom_type': geom_type, 'features': features, 'geometry_store': loaded_layer['geometry_store'], 'graphics_items': [], 'is_calculable': is_calculable, 'is_calc_target': is_calculable}
                 self.project.add_layer(layer_info)
                 list_item = QListWidgetItem(item_text)
                 if is_calculable:
@@ -737,11 +886,16 @@ class X_Grid(QMainWindow):
                 else:
                     QMessageBox.warning(self, "読み込みエラー", f"レイヤ '{layer_name}' の読み込みに失敗しました。\n詳細: {e}")
                 continue
+            except ValueError as e:
+                QMessageBox.warning(self, "読み込みエラー", str(e))
+                continue
             except Exception as e:
                 QMessageBox.warning(self, "読み込みエラー", f"予期せぬエラーが発生しました。\n詳細: {e}")
                 continue
                 
         self.layer_list_widget.blockSignals(False); self.layer_list_widget.setCurrentRow(0)
+        if new_layers_added:
+            self._invalidate_coverage_cache()
         self.on_layer_item_changed()
         self._evaluate_and_set_readiness_state()
         return new_layers_added
@@ -752,6 +906,7 @@ class X_Grid(QMainWindow):
 
         self.project.remove_layer(current_row)
         self.layer_list_widget.takeItem(current_row)
+        self._invalidate_coverage_cache()
         
         self.clear_all_calculation_settings()
         
@@ -767,6 +922,7 @@ class X_Grid(QMainWindow):
 
     def clear_all_calculation_settings(self):
         self.project.reset_calculation_settings()
+        self._invalidate_coverage_cache()
         self.project.remove_all_annotations()
         self.renderer.clear_all_calculation_graphics()
         if self.view:
@@ -810,6 +966,8 @@ class X_Grid(QMainWindow):
     def update_layout_and_redraw(self):
         self.project.update_master_bbox(); layout_changed, info_message = self.project.determine_layout()
         if layout_changed and info_message: QMessageBox.information(self, "レイアウト情報", info_message)
+        # 回転やグリッドが変わると、事前計算した土場のプレビューのセル位置が合わなくなる
+        if layout_changed: self._clear_landing_preview()
         self.renderer.full_redraw()
         self.view.auto_fit_view()
 
@@ -1254,7 +1412,7 @@ class X_Grid(QMainWindow):
         
         temp_scene = QGraphicsScene()
         temp_renderer = MapRenderer(temp_scene, temp_project, for_pdf=True)
-        temp_calculator = Calculator(temp_project, temp_renderer)
+        temp_calculator = Calculator(temp_project, temp_renderer.transform)
         temp_project.calculator = temp_calculator
         
         temp_renderer.full_redraw(for_pdf=True)
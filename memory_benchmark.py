@@ -0,0 +1,85 @@
+#--- START OF FILE memory_benchmark.py ---
+"""
+X_Grid レイヤ保持方式のメモリ比較
+
+1つのレイヤを次の2通りで読み込み、Python側で確保されたメモリ量 (tracemalloc) と読み込み時間を比べる。
+    従来方式 : fionaの地物リスト (list(collection)) + 解析済みジオメトリの配列
+    列指向   : FeatureTable (ジオメトリ配列 + スタイル属性の列)
+shapely ジオメトリの座標はどちらの方式でも GEOS 側に同じ量だけ確保され、tracemalloc では計測されない。
+そのため、差はおおむね fiona の地物 (座標の入れ子タプルと属性の辞書) の分となる。
+
+使用例:
+    python memory_benchmark.py 林班.gpkg --layer 小班界
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+import fiona
+import numpy as np
+from shapely.geometry import shape
+
+from feature_table import FeatureTable
+
+
+def _parse_geoms(features):
+    geoms = np.full(len(features), None, dtype=object)
+    for i, feature in enumerate(features):
+        if feature.get('geometry'):
+            geoms[i] = shape(feature['geometry'])
+    return geoms
+
+
+def load_feature_list(path, layer_name):
+    """従来方式: fionaの地物をすべてリストで保持し、ジオメトリを別に解析する"""
+    with fiona.open(path, 'r', layer=layer_name) as c:
+        features = list(c)
+    return features, _parse_geoms(features)
+
+
+def load_feature_table(path, layer_name):
+    """列指向: 地物を読みながら FeatureTable の列に振り分ける"""
+    with fiona.open(path, 'r', layer=layer_name) as c:
+        return FeatureTable.from_features(c, source=(path, layer_name, None))
+
+
+def measure(load, *args):
+    """load(*args) の結果を保持したままの確保メモリ量 (バイト)、ピーク、所要時間 (秒) を返す"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return current, peak, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="X_Grid レイヤ保持方式のメモリ比較")
+    parser.add_argument('input', help="レイヤを含むファイル (.gpkg, .shp など)")
+    parser.add_argument('--layer', help="レイヤ名 (省略時は先頭のレイヤ)")
+    args = parser.parse_args(argv)
+
+    layer_name = args.layer or fiona.listlayers(args.input)[0]
+    with fiona.open(args.input, 'r', layer=layer_name) as c:
+        feature_count = len(c)
+    print(f"{args.input} ({layer_name}): {feature_count} 地物")
+
+    results = {}
+    for label, load in [("従来方式 (地物リスト)", load_feature_list), ("列指向 (FeatureTable)", load_feature_table)]:
+        current, peak, elapsed = measure(load, args.input, layer_name)
+        results[label] = current
+        print(f"  {label}: 保持 {current / 2**20:8.1f} MB / ピーク {peak / 2**20:8.1f} MB / {elapsed:6.2f} 秒")
+    old_size, new_size = results.values()
+    if new_size > 0:
+        print(f"  保持メモリ比: {old_size / new_size:.1f} 倍")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
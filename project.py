@@ -1,12 +1,14 @@
 #--- START OF FILE project.py ---
 
 import uuid
+import numpy as np
+import shapely
 from PyQt6.QtGui import QPageLayout, QFont, QColor
-from shapely.geometry import shape, Polygon, MultiPolygon, LineString
+from shapely.geometry import Polygon, MultiPolygon, LineString
 from shapely.ops import unary_union, polygonize
-from shapely.affinity import rotate, scale
 
 from app_state import AppState
+from geometry_store import get_geometry_store
 
 class Project:
     def __init__(self):
@@ -25,6 +27,8 @@ class Project:
         self.title_is_displayed = False
         self.calculator = None
         self.snapping_enabled = False
+        # スナップの方式 ('edge': 線上の最近傍点, 'vertex': 頂点・交点を優先し、なければ線上)
+        self.snap_mode = 'edge'
         self.tracing_enabled = False
 
         # --- 地図制御 ---
@@ -33,6 +37,8 @@ class Project:
         # MODIFIED: 地図のパン操作によるオフセット値を追加
         self.map_offset_x = 0
         self.map_offset_y = 0
+        # 用紙に収まる回転角を探す刻み (度)。0°, 90° の次に、この刻みで 0〜90° を順に調べる
+        self.layout_angle_step = 5
         
         # --- 計算設定 (リセット対象) ---
         self.is_split_mode = False
@@ -52,6 +58,12 @@ class Project:
         self.label_positions = {}
         self.text_annotations = {}
 
+        # --- 結合ジオメトリのキャッシュ ---
+        # レイヤの追加・削除、計算対象の変更、地物の編集でのみ無効化する
+        self._combined_geom_cache = {}
+        self.geom_cache_hits = 0
+        self.geom_cache_misses = 0
+
 
     def reset_calculation_settings(self):
         self.is_split_mode = False
@@ -166,7 +178,9 @@ class Project:
             })
 
     def add_layer(self, layer_info):
+        get_geometry_store(layer_info)
         self.layers.insert(0, layer_info)
+        self.invalidate_geometry_cache()
 
     def remove_layer(self, index):
         if 0 <= index < len(self.layers):
@@ -178,6 +192,7 @@ class Project:
             for key in keys_to_delete:
                 del self.label_positions[key]
             self.layers.pop(index)
+            self.invalidate_geometry_cache()
 
     def move_layer_up(self, index):
         if index > 0: self.layers.insert(index - 1, self.layers.pop(index))
@@ -186,59 +201,53 @@ class Project:
         if 0 <= index < len(self.layers) - 1: self.layers.insert(index + 1, self.layers.pop(index))
             
     def set_calc_target_status(self, index, is_target):
-        if 0 <= index < len(self.layers): self.layers[index]['is_calc_target'] = is_target
+        if 0 <= index < len(self.layers):
+            # 画面のレイヤ一覧の更新のたびに全レイヤについて呼ばれるため、変化がなければ結合ジオメトリを残す
+            if self.layers[index].get('is_calc_target') == is_target: return
+            self.layers[index]['is_calc_target'] = is_target
+            self.invalidate_geometry_cache()
+
+    def invalidate_geometry_cache(self):
+        """結合ジオメトリのキャッシュを破棄する。地物を編集した場合も呼び出すこと"""
+        self._combined_geom_cache.clear()
 
     def update_master_bbox(self):
+        """
+        全レイヤの外接矩形をマスターBBoxとする。
+        各レイヤの外接矩形は読み込み時にジオメトリストアで求めてあるため、
+        ジオメトリを結合せずにレイヤ数分の最小・最大値の集計だけで済む。
+        """
         self.master_bbox = None
-        all_geoms_for_bbox = []
-        
-        for layer in self.layers:
-            if 'features' not in layer or not layer['features']:
-                continue
-
-            for feature in layer['features']:
-                if 'geometry' not in feature or not feature['geometry']:
-                    continue
-                try:
-                    geom = shape(feature['geometry'])
-                    if not geom.is_valid:
-                        geom = geom.buffer(0)
-                    if geom and not geom.is_empty:
-                        all_geoms_for_bbox.append(geom)
-                except Exception:
-                    continue
-
-        if not all_geoms_for_bbox:
+        layer_bounds = np.array([get_geometry_store(layer).total_bounds for layer in self.layers if layer.get('features')]).reshape(-1, 4)
+        layer_bounds = layer_bounds[~np.isnan(layer_bounds).any(axis=1)]
+        if len(layer_bounds) == 0:
             return
 
-        try:
-            master_geom = unary_union(all_geoms_for_bbox)
-            if not master_geom.is_empty:
-                self.master_bbox = list(master_geom.bounds)
-        except Exception as e:
-            print(f"マスターBBox結合エラー: {e}")
-            self.master_bbox = None
+        self.master_bbox = [
+            float(layer_bounds[:, 0].min()), float(layer_bounds[:, 1].min()),
+            float(layer_bounds[:, 2].max()), float(layer_bounds[:, 3].max())
+        ]
 
     def determine_layout(self):
         if not self.master_bbox:
             self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, 0
             return False, ""
-        master_geom = self._get_combined_all_layers_geom()
+        hull_coords = self._get_layout_hull_coords()
         info_message, layout_found = "", False
         final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation = self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation
         
-        if master_geom and not master_geom.is_empty:
+        if hull_coords is not None:
             a4_width_m, a4_height_m = self.grid_cols_a4 * self.k_value, self.grid_rows_a4 * self.k_value
             a3_width_m, a3_height_m = self.grid_cols_a3 * self.k_value, self.grid_rows_a3 * self.k_value
             
-            optimal_angle_a4 = self._find_optimal_rotation(master_geom, a4_width_m, a4_height_m)
+            optimal_angle_a4 = self._find_optimal_rotation(hull_coords, a4_width_m, a4_height_m)
             
             if optimal_angle_a4 is not None:
                 final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, optimal_angle_a4
                 info_message = f"A4縦に収めるため、{optimal_angle_a4}°回転しました。" if optimal_angle_a4 != 0 else "A4縦に収まります。"
                 layout_found = True
             else:
-                optimal_angle_a3 = self._find_optimal_rotation(master_geom, a3_width_m, a3_height_m)
+                optimal_angle_a3 = self._find_optimal_rotation(hull_coords, a3_width_m, a3_height_m)
                 if optimal_angle_a3 is not None:
                     final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, optimal_angle_a3
                     info_message = "A4サイズに収まらないため、A3モードに切り替えます。"
@@ -259,42 +268,60 @@ class Project:
         return layout_changed, info_message if layout_changed else ""
         
     def _get_combined_calculable_geom(self):
-        all_shapely_polygons = []
         calculable_layers = [layer for layer in self.layers if layer.get('is_calc_target') and layer.get('is_calculable')]
         if not calculable_layers: return None
-        for layer in calculable_layers:
-            for feature in layer['features']:
-                geom_dict = feature.get('geometry')
-                if not geom_dict: continue
-                try:
-                    shapely_geom = shape(geom_dict)
-                    if not shapely_geom.is_valid: shapely_geom = shapely_geom.buffer(0)
-                    if shapely_geom and not shapely_geom.is_empty:
-                        all_shapely_polygons.append(shapely_geom)
-                except Exception: continue
-        if not all_shapely_polygons: return None
-        return unary_union(all_shapely_polygons)
+        return self._get_cached_combined_geom('calculable', calculable_layers)
 
     def _get_combined_all_layers_geom(self):
-        all_geoms = []
-        for layer in self.layers:
-            for feature in layer['features']:
-                geom_dict = feature.get('geometry')
-                if not geom_dict: continue
-                try:
-                    shapely_geom = shape(geom_dict)
-                    if not shapely_geom.is_valid: shapely_geom = shapely_geom.buffer(0)
-                    if shapely_geom and not shapely_geom.is_empty:
-                        all_geoms.append(shapely_geom)
-                except Exception: continue
-        if not all_geoms: return None
-        return unary_union(all_geoms)
-
-    def _find_optimal_rotation(self, geom, target_width, target_height):
-        if geom is None or geom.is_empty: return None
-        for angle in [0, 90] + list(range(5, 90, 5)):
-            rotated_geom = rotate(geom, angle, origin='center', use_radians=False)
-            min_x, min_y, max_x, max_y = rotated_geom.bounds
-            width, height = max_x - min_x, max_y - min_y
-            if width <= target_width and height <= target_height: return angle
-        return None
\ No newline at end of file
+        if not self.layers: return None
+        return self._get_cached_combined_geom('all_layers', self.layers)
+
+    def _get_cached_combined_geom(self, cache_name, layers):
+        """
+        レイヤ群の修復済みジオメトリを結合した(prepare済みの)ジオメトリを返す。
+        結合元のジオメトリストアが同じ間はキャッシュを使い、ストアが作り直されていれば再結合する。
+        """
+        stores = tuple(get_geometry_store(layer) for layer in layers)
+        cached = self._combined_geom_cache.get(cache_name)
+        if cached is not None and len(cached[0]) == len(stores) and all(a is b for a, b in zip(cached[0], stores)):
+            self.geom_cache_hits += 1
+            return cached[1]
+
+        self.geom_cache_misses += 1
+        all_geoms = np.concatenate([store.get_repaired_geoms() for store in stores])
+        combined_geom = unary_union(all_geoms) if len(all_geoms) > 0 else None
+        if combined_geom is not None:
+            # 土場選択時の交差判定などの述語を繰り返し高速に評価できるようにする
+            shapely.prepare(combined_geom)
+        self._combined_geom_cache[cache_name] = (stores, combined_geom)
+        return combined_geom
+
+    def _get_layout_hull_coords(self):
+        """
+        全レイヤの凸包の頂点座標を返す。回転後の外接矩形の大きさは凸包だけで決まるため、
+        レイアウト判定ではジオメトリ全体の代わりに頂点数の少ない凸包を使う。
+        """
+        hulls = [get_geometry_store(layer).convex_hull for layer in self.layers]
+        hulls = [hull for hull in hulls if hull is not None]
+        if not hulls: return None
+        hull = shapely.convex_hull(shapely.geometrycollections(hulls))
+        # 大きな平面直角座標のまま回転すると桁落ちするため、外接矩形の中心を原点に移す
+        coords = shapely.get_coordinates(hull)
+        return coords - (coords.min(axis=0) + coords.max(axis=0)) / 2
+
+    def _get_layout_angles(self):
+        step = self.layout_angle_step
+        return [0, 90] + np.arange(step, 90, step).tolist()
+
+    def _find_optimal_rotation(self, hull_coords, target_width, target_height):
+        """凸包を候補の角度で一括回転し、用紙に収まる最初の角度を返す。収まらない場合は None"""
+        if hull_coords is None or len(hull_coords) == 0: return None
+        angles = self._get_layout_angles()
+        theta = np.radians(angles)
+        x, y = hull_coords[:, :1], hull_coords[:, 1:]
+        rotated_x = x * np.cos(theta) - y * np.sin(theta)
+        rotated_y = x * np.sin(theta) + y * np.cos(theta)
+        widths = rotated_x.max(axis=0) - rotated_x.min(axis=0)
+        heights = rotated_y.max(axis=0) - rotated_y.min(axis=0)
+        fits = np.flatnonzero((widths <= target_width) & (heights <= target_height))
+        return angles[fits[0]] if len(fits) > 0 else None
\ No newline at end of file
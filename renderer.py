@@ -1,14 +1,19 @@
-import math
 from decimal import Decimal, ROUND_HALF_UP, ROUND_DOWN
 from PyQt6.QtCore import Qt, QRectF, QPointF, pyqtSignal
 from PyQt6.QtGui import (
-    QColor, QPen, QBrush, QFont, QPolygonF, QPainterPath, QFontMetrics
+    QColor, QPen, QBrush, QFont, QPolygonF, QPainterPath, QFontMetrics, QTransform
 )
-from PyQt6.QtWidgets import QGraphicsTextItem, QGraphicsSceneMouseEvent
-from shapely.geometry import box, shape, Polygon, MultiPolygon, LineString, MultiLineString, Point
+from PyQt6.QtWidgets import QGraphicsTextItem, QGraphicsPathItem, QGraphicsSceneMouseEvent
+from shapely.geometry import box, shape, LineString, MultiLineString, Point
 from shapely.ops import unary_union, nearest_points
+import shapely
+import numpy as np
 
 from utils import DEFAULT_STYLE_INFO, _parse_any_color_string
+from grid_transform import GridTransform
+from geometry_store import get_geometry_store
+from vertex_index import VertexGridIndex
+from trace_engine import LineTracer
 from report_generator import ReportGenerator
 
 
@@ -45,75 +50,100 @@ class MapRenderer:
             self.grid_offset_x, self.grid_offset_y = 80, 150
         else:
             self.grid_offset_x, self.grid_offset_y = 60, 40
+        # ワールド座標とシーン座標の変換 (Qtに依存しないため計算クラスと共有する)
+        self.transform = GridTransform(project, self.grid_offset_x, self.grid_offset_y)
 
         self.Z_GRID, self.Z_DATA_LAYERS_BASE, self.Z_AREA_OUTLINE, self.Z_OVERLAYS_BASE = 0, 1, 50, 100
         
         self.grid_items, self.compass_items, self.calculation_items, self.title_items, self.pointer_items, self.annotation_items = [], [], [], [], [], []
         self.in_area_cells_outline, self.temp_splitting_line_item, self.fixed_split_line_items = None, None, []
         self.trace_preview_item = None
+        self.landing_suggestion_item = None
+        # パン操作中にレイヤの描画アイテムをまとめて動かすグループ
+        self._pan_group = None
+        # スナップ対象ジオメトリの空間インデックス (レイヤ構成が変わったときだけ作り直す)
+        self._snap_index = None
+        # トレース対象の線ごとの線形参照 (id(ジオメトリ) → (ジオメトリ, LineTracerのリスト))
+        self._line_tracers = {}
+        # 地物ごとの描画キャッシュ ((id(ジオメトリストア), 地物番号) → 回転角・簡略化段階・切り取り範囲・スタイル・パス・ペン・ブラシ)
+        self._feature_render_cache = {}
+        # 画面表示用の簡略化ジオメトリの段階 (許容値 m) と、許容する画面上のずれ (ピクセル)
+        self.LOD_TOLERANCES = (0.25, 1.0, 5.0)
+        self.LOD_MAX_ERROR_PIXELS = 0.25
+        # 用紙の範囲からこの余白 (シーン座標) 以上はみ出す地物は描画しない・切り取る
+        self.CULL_MARGIN = 50
+        # パン中に用紙の外から入ってくる地物を表示するため、パン開始時に広げる余白 (シーン座標)
+        self.PAN_CULL_MARGIN = 500
+        self.view_zoom = 1.0
 
         self._setup_drawing_styles()
         self.report_generator = ReportGenerator()
 
     def scene_to_world(self, scene_pos):
-        params = self._get_transform_parameters()
-        if not params:
-            return None
-
-        pos_no_offset = scene_pos
-        relative_x = pos_no_offset.x() - params['grid_center_x']
-        relative_y = -(pos_no_offset.y() - params['grid_center_y'])
-        world_dx = relative_x / params['scale']
-        world_dy = relative_y / params['scale']
-        unrotated_world_x = params['center_x'] + world_dx
-        unrotated_world_y = params['center_y'] + world_dy
-        final_world_coords = self._apply_rotation_to_coords([(unrotated_world_x, unrotated_world_y)], inverse=True)
-        return final_world_coords[0]
+        return self.transform.scene_to_world(scene_pos.x(), scene_pos.y())
 
     def world_geom_to_scene_geom(self, world_geom):
-        params = self._get_transform_parameters()
-        if not params: return None
-        def transform_geom_coords(coords):
-            rotated_coords = self._apply_rotation_to_coords(coords)
-            return [(params['grid_center_x'] + (p[0] - params['center_x']) * params['scale'], params['grid_center_y'] - (p[1] - params['center_y']) * params['scale']) for p in rotated_coords]
-        try:
-            if isinstance(world_geom, Polygon):
-                return Polygon(transform_geom_coords(world_geom.exterior.coords), [transform_geom_coords(i.coords) for i in world_geom.interiors])
-            elif isinstance(world_geom, MultiPolygon):
-                polys = [Polygon(transform_geom_coords(p.exterior.coords), [transform_geom_coords(i.coords) for i in p.interiors]) for p in world_geom.geoms if p.exterior]
-                return MultiPolygon(polys)
-            elif isinstance(world_geom, LineString):
-                return LineString(transform_geom_coords(world_geom.coords))
-            elif isinstance(world_geom, MultiLineString):
-                lines = [LineString(transform_geom_coords(line.coords)) for line in world_geom.geoms]
-                return MultiLineString(lines)
-            elif world_geom.geom_type == 'Point':
-                coords = transform_geom_coords([world_geom.coords[0]])
-                return shape({'type': 'Point', 'coordinates': coords[0]})
-
-        except Exception as e:
-            print(f"シーンジオメトリ変換エラー: {e}")
-            return None
-        return None
+        return self.transform.world_geom_to_scene_geom(world_geom)
     
     def _get_snap_geometries(self):
         snap_geoms = []
         for layer in self.project.layers:
-            for feature in layer['features']:
-                geom_dict = feature.get('geometry')
-                if not geom_dict: continue
-                try:
-                    shapely_geom = shape(geom_dict)
-                    if not shapely_geom or shapely_geom.is_empty: continue
-
-                    if "Polygon" in shapely_geom.geom_type:
-                        snap_geoms.append(shapely_geom.boundary)
-                    elif "LineString" in shapely_geom.geom_type or "Point" in shapely_geom.geom_type:
-                        snap_geoms.append(shapely_geom)
-                except Exception:
-                    continue
+            for shapely_geom in get_geometry_store(layer).get_geoms():
+                if "Polygon" in shapely_geom.geom_type:
+                    snap_geoms.append(shapely_geom.boundary)
+                elif "LineString" in shapely_geom.geom_type or "Point" in shapely_geom.geom_type:
+                    snap_geoms.append(shapely_geom)
         return snap_geoms
 
+    def _get_snap_index(self):
+        """
+        スナップ対象ジオメトリの配列、そのSTRtree、全頂点の格子ハッシュ索引を返す。
+        レイヤのジオメトリストアの組が変わらない間は、前回作成したものを使い回す。
+        """
+        stores = tuple(get_geometry_store(layer) for layer in self.project.layers)
+        if self._snap_index is not None and len(self._snap_index[0]) == len(stores) and all(a is b for a, b in zip(self._snap_index[0], stores)):
+            return self._snap_index[1:]
+
+        snap_geoms = np.array(self._get_snap_geometries(), dtype=object)
+        tree = shapely.STRtree(snap_geoms) if len(snap_geoms) > 0 else None
+        vertex_index = VertexGridIndex(*shapely.get_coordinates(snap_geoms, return_index=True)) if len(snap_geoms) > 0 else None
+        self._snap_index = (stores, snap_geoms, tree, vertex_index)
+        self._line_tracers = {}
+        return snap_geoms, tree, vertex_index
+
+    def _find_vertex_snap(self, snap_geoms, tree, vertex_index, mouse_world_point, world_tolerance):
+        """
+        【頂点スナップ】許容距離内にある既存の頂点、またはジオメトリ同士の交点のうち最も近いものを探す。
+        戻り値は (スナップ点, スナップ先のジオメトリ番号)。見つからなければ None。
+        """
+        candidates = []
+        nearest_vertex = vertex_index.query_nearest(mouse_world_point.x, mouse_world_point.y, world_tolerance)
+        if nearest_vertex:
+            coords, geom_index, distance = nearest_vertex
+            candidates.append((distance, geom_index, Point(coords)))
+
+        # 交点はマウス付近のジオメトリ同士についてだけ、許容範囲の矩形で切り取った部分どうしで求める
+        # (大きなジオメトリ全体の交差計算をマウス移動のたびに行わないため)
+        nearby = np.sort(tree.query(mouse_world_point, predicate='dwithin', distance=world_tolerance))
+        if len(nearby) > 1:
+            x, y = mouse_world_point.x, mouse_world_point.y
+            clipped = shapely.clip_by_rect(snap_geoms[nearby], x - world_tolerance, y - world_tolerance, x + world_tolerance, y + world_tolerance)
+            first, second = np.triu_indices(len(nearby), k=1)
+            intersections = shapely.intersection(clipped[first], clipped[second])
+            parts, pair_index = shapely.get_parts(intersections, return_index=True)
+            is_point = shapely.get_type_id(parts) == 0
+            points, pair_index = parts[is_point], pair_index[is_point]
+            if len(points) > 0:
+                distances = shapely.distance(points, mouse_world_point)
+                best = np.argmin(distances)
+                if distances[best] <= world_tolerance:
+                    candidates.append((float(distances[best]), int(nearby[first[pair_index[best]]]), points[best]))
+
+        candidates = [c for c in candidates if c[0] < world_tolerance]
+        if not candidates: return None
+        distance, geom_index, point = min(candidates, key=lambda c: (c[0], c[1]))
+        return point, geom_index
+
     def find_snap_point(self, scene_pos, scene_tolerance):
         if not self.project.layers: return None, None
         params = self._get_transform_parameters()
@@ -125,106 +155,72 @@ class MapRenderer:
         
         mouse_world_point = Point(mouse_world_coords)
         
-        snap_geoms = self._get_snap_geometries()
-        if not snap_geoms: return None, None
-        
-        try:
-            combined_geoms = unary_union(snap_geoms)
-            if combined_geoms.is_empty: return None, None
-        except Exception:
-            return None, None 
-
-        p1, p2 = nearest_points(combined_geoms, mouse_world_point)
-        
-        if p1.distance(p2) < world_tolerance:
-            scene_snap_geom = self.world_geom_to_scene_geom(p1)
-            if scene_snap_geom:
-                snapped_on_geom = None
-                min_dist = float('inf')
-                for geom in snap_geoms:
-                    dist = p1.distance(geom)
-                    if dist < min_dist:
-                        min_dist = dist
-                        snapped_on_geom = geom
-                
-                return QPointF(scene_snap_geom.x, scene_snap_geom.y), snapped_on_geom
+        snap_geoms, tree, vertex_index = self._get_snap_index()
+        if tree is None: return None, None
+
+        if self.project.snap_mode == 'vertex':
+            vertex_snap = self._find_vertex_snap(snap_geoms, tree, vertex_index, mouse_world_point, world_tolerance)
+            if vertex_snap:
+                point, geom_index = vertex_snap
+                scene_snap_geom = self.world_geom_to_scene_geom(point)
+                if scene_snap_geom:
+                    return QPointF(scene_snap_geom.x, scene_snap_geom.y), snap_geoms[geom_index]
+            # 許容距離内に頂点・交点がなければ、線上へのスナップにフォールバックする
+
+        # 許容距離内で最も近いジオメトリを空間インデックスで探す
+        indices, distances = tree.query_nearest(mouse_world_point, max_distance=world_tolerance, return_distance=True)
+        if len(indices) == 0 or distances.min() >= world_tolerance: return None, None
+        p1, _ = nearest_points(snap_geoms[indices.min()], mouse_world_point)
+
+        # 隣接ポリゴンの共有境界のように複数のジオメトリ上にある場合は、スナップ点に最も近いもの(同距離ならレイヤ順で先のもの)を選ぶ
+        candidates = np.sort(tree.query(p1, predicate='dwithin', distance=world_tolerance))
+        snapped_on_geom = snap_geoms[candidates[np.argmin(shapely.distance(snap_geoms[candidates], p1))]]
+        scene_snap_geom = self.world_geom_to_scene_geom(p1)
+        if scene_snap_geom:
+            return QPointF(scene_snap_geom.x, scene_snap_geom.y), snapped_on_geom
         
         return None, None
 
+    def _get_line_tracers(self, trace_geom):
+        """トレース対象ジオメトリを構成する各線の LineTracer (ジオメトリごとに一度だけ作成する)"""
+        cached = self._line_tracers.get(id(trace_geom))
+        if cached is not None and cached[0] is trace_geom: return cached[1]
+        lines = trace_geom.geoms if isinstance(trace_geom, MultiLineString) else [trace_geom]
+        tracers = [LineTracer(line) for line in lines if not line.is_empty]
+        self._line_tracers[id(trace_geom)] = (trace_geom, tracers)
+        return tracers
+
     def find_trace_points(self, trace_geom, start_point_world, end_point_world):
+        """
+        【トレース】trace_geom 上の始点から終点までの間にある頂点と終点を、シーン座標の点列で返す(始点は含まない)。
+        マルチラインでは両点に最も近い線をたどる。間に頂点がなければ None。
+        """
         if not isinstance(trace_geom, (LineString, MultiLineString)):
             return None
 
-        lines_to_trace = list(trace_geom.geoms) if isinstance(trace_geom, MultiLineString) else [trace_geom]
-
-        for line in lines_to_trace:
-            try:
-                start_dist = line.project(start_point_world)
-                end_dist = line.project(end_point_world)
-
-                if abs(start_dist - end_dist) < 1e-9: continue
-
-                coords = list(line.coords)
-                
-                if start_dist > end_dist:
-                    start_dist, end_dist = end_dist, start_dist
-                    coords.reverse()
-
-                trace_coords = []
-                in_segment = False
-                for i in range(len(coords)):
-                    p_dist = line.project(Point(coords[i]))
-                    
-                    if p_dist >= start_dist and p_dist <= end_dist:
-                        if not in_segment:
-                            trace_coords.append(start_point_world.coords[0])
-                            if p_dist > start_dist:
-                                trace_coords.append(coords[i])
-                            in_segment = True
-                        else:
-                            trace_coords.append(coords[i])
-                    elif in_segment:
-                        break
-                
-                trace_coords.append(end_point_world.coords[0])
-
-                if len(trace_coords) >= 2:
-                    if Point(trace_coords[0]).equals(start_point_world):
-                        trace_coords.pop(0)
-
-                    return [QPointF(p.x, p.y) for p in [self.world_geom_to_scene_geom(Point(c)) for c in trace_coords] if p]
-
-            except Exception as e:
-                print(f"Trace error: {e}")
-                continue
-
-        return None
+        try:
+            tracers = self._get_line_tracers(trace_geom)
+            if not tracers: return None
+            located = []
+            for tracer in tracers:
+                start_dist, start_offset = tracer.locate(start_point_world.x, start_point_world.y)
+                end_dist, end_offset = tracer.locate(end_point_world.x, end_point_world.y)
+                located.append((max(start_offset, end_offset), tracer, start_dist, end_dist))
+            _, tracer, start_dist, end_dist = min(located, key=lambda item: item[0])
+            if abs(start_dist - end_dist) < 1e-9: return None
+
+            vertices = tracer.get_vertices_between(start_dist, end_dist)
+            if len(vertices) == 0: return None
+            trace_coords = np.vstack([vertices, [(end_point_world.x, end_point_world.y)]])
+            scene_coords = self.transform.transform_coords(trace_coords)
+            if scene_coords is None: return None
+            return [QPointF(x, y) for x, y in scene_coords]
+        except Exception as e:
+            print(f"Trace error: {e}")
+            return None
     
-    def is_cell_on_boundary(self, row, col, target_geom):
-        if not target_geom: return False
-        
-        cell_world_poly = self.get_cell_world_polygon(row, col)
-        if not cell_world_poly: return False
-
-        return cell_world_poly.intersects(target_geom.boundary)
-
     def get_cell_world_polygon(self, row, col):
-        params = self._get_transform_parameters()
-        if not params: return None
-
-        cs = self.project.cell_size_on_screen
-        scene_x1 = self.grid_offset_x + col * cs
-        scene_y1 = self.grid_offset_y + row * cs
-        scene_poly = box(scene_x1, scene_y1, scene_x1 + cs, scene_y1 + cs)
-        
-        world_coords = []
-        for sx, sy in list(scene_poly.exterior.coords):
-            world_coord = self.scene_to_world(QPointF(sx, sy))
-            if world_coord:
-                world_coords.append(world_coord)
-        
-        if len(world_coords) < 4: return None
-        return Polygon(world_coords)
+        return self.transform.get_cell_world_polygon(row, col)
 
     def _handle_label_moved(self, unique_id, new_scene_pos):
         item_rect = QFontMetrics(self.fonts['data_bold']).boundingRect("Dummy")
@@ -247,15 +243,13 @@ class MapRenderer:
         height = self.project.grid_rows * self.project.cell_size_on_screen
         return QRectF(self.grid_offset_x, self.grid_offset_y, width, height)
 
+    def get_page_rect(self):
+        """グリッドの周囲の余白(タイトル・計算表など)を含めた用紙の範囲"""
+        return self.get_grid_rect().adjusted(-80, -150, 70, 150)
+
     def get_full_content_rect(self):
         if not self.scene or not self.scene.items():
-            grid_width = self.project.grid_cols * self.project.cell_size_on_screen
-            grid_height = self.project.grid_rows * self.project.cell_size_on_screen
-            min_x = self.grid_offset_x - 80
-            min_y = self.grid_offset_y - 150
-            width = grid_width + 150
-            height = grid_height + 300
-            return QRectF(min_x, min_y, width, height)
+            return self.get_page_rect()
 
         content_rect = self.scene.itemsBoundingRect()
         
@@ -309,6 +303,8 @@ class MapRenderer:
         self.pointer_items.clear()
         self.annotation_items.clear()
         self.in_area_cells_outline, self.temp_splitting_line_item = None, None
+        self.landing_suggestion_item = None
+        self._pan_group = None
         self.fixed_split_line_items.clear()
         
         for layer in self.project.layers:
@@ -324,6 +320,7 @@ class MapRenderer:
         self.in_area_cells_outline = None
         
         self.clear_all_pointers()
+        self.clear_landing_suggestion()
         self.clear_temporary_splitting_line()
         for item in self.fixed_split_line_items:
             if item.scene(): self.scene.removeItem(item)
@@ -333,110 +330,251 @@ class MapRenderer:
         self.project.title_is_displayed = False
         self.draw_grid()
 
+    def begin_pan(self):
+        """
+        【パン開始】レイヤの描画アイテムを1つのグループにまとめる。
+        パン中はこのグループを平行移動するだけにして、シーン全体の再描画を避ける。
+        注記・分割線・計算結果はパン開始時に計算設定とともに消去される (MyGraphicsView) ため、グループには含めない。
+        用紙の外から入ってくる地物も表示されるよう、開始時に PAN_CULL_MARGIN まで広げた範囲で地物を描き直す
+        (それより遠くから入ってくる地物は、パン終了時の描き直しで表示される)。
+        """
+        self.end_pan(refresh=False)
+        self._draw_layer_features(cull_margin=self.PAN_CULL_MARGIN)
+        items = [item for layer in self.project.layers for item in layer.get('graphics_items', []) if item and item.scene()]
+        if items:
+            self._pan_group = self.scene.createItemGroup(items)
+            self._pan_group.setZValue(self.Z_DATA_LAYERS_BASE)
+        # 区域セルの外枠はグリッドとの位置関係で決まるため、パン中は非表示にして終了時に作り直す
+        if self.in_area_cells_outline and self.in_area_cells_outline.scene():
+            self.in_area_cells_outline.setVisible(False)
+
+    def pan_by(self, dx, dy):
+        """【パン】地図のオフセットを (dx, dy) だけずらし、グループを同じだけ動かす"""
+        self.project.map_offset_x += dx
+        self.project.map_offset_y += dy
+        if self._pan_group is not None:
+            self._pan_group.moveBy(dx, dy)
+        else:
+            self.full_redraw()
+
+    def end_pan(self, refresh=True):
+        """
+        【パン終了】グループを解除し、ページ範囲が変わったレイヤの地物と、
+        グリッドに依存する区域セルの外枠を作り直す
+        """
+        if self._pan_group is not None:
+            if self._pan_group.scene():
+                self.scene.destroyItemGroup(self._pan_group)
+            self._pan_group = None
+        if refresh:
+            self._draw_layer_features()
+            self.update_area_outline()
+
     def redraw_all_layers(self):
+        layers_drawn = self._draw_layer_features()
+        self.draw_compass()
+        if layers_drawn:
+            self.draw_area_labels()
+
+    def set_view_zoom(self, view_zoom):
+        """
+        ビューの拡大率 (シーン1単位あたりの画面ピクセル数) を設定する。
+        使用する簡略化ジオメトリの段階が変わったときは、レイヤの地物だけを描き直す。
+        """
+        previous_tolerance = self._get_lod_tolerance()
+        self.view_zoom = view_zoom
+        if self._get_lod_tolerance() != previous_tolerance:
+            self._draw_layer_features()
+
+    def _get_lod_tolerance(self):
+        """
+        描画に使う簡略化の許容値 (m)。単純化による形のずれが画面上で LOD_MAX_ERROR_PIXELS 以下に収まる
+        最も粗い段階を選ぶ。PDF出力時と、どの段階でもずれが目立つほど拡大している場合は None (元の解像度)。
+        """
+        if self.for_pdf: return None
+        params = self.transform.get_parameters()
+        if not params: return None
+        pixels_per_meter = params['scale'] * self.view_zoom
+        usable = [tolerance for tolerance in self.LOD_TOLERANCES if tolerance * pixels_per_meter <= self.LOD_MAX_ERROR_PIXELS]
+        return max(usable) if usable else None
+
+    def _draw_layer_features(self, cull_margin=None):
+        """
+        レイヤの地物を描き直す。描画できる範囲(bbox)がまだなければ False を返す。
+        cull_margin は描画対象とする用紙の外側の余白 (省略時は CULL_MARGIN)。
+        """
         for layer in self.project.layers:
             for item in layer.get('graphics_items', []):
                 if item and item.scene():
                     self.scene.removeItem(item)
             layer['graphics_items'] = []
         
-        if not self.project.master_bbox:
-            self.draw_compass()
-            return
-        
+        if not self.project.master_bbox: return False
+        item_transform = self._get_feature_item_transform()
+        if item_transform is None: return False
+        scale = self.transform.get_parameters()['scale']
+        lod_tolerance = self._get_lod_tolerance()
+        cull_window, cull_key = self._get_cull_window(self.CULL_MARGIN if cull_margin is None else cull_margin)
+
+        # 今回描画しない地物(削除されたレイヤなど)のキャッシュはここで捨てる
+        previous_cache, self._feature_render_cache = self._feature_render_cache, {}
         for i, layer in enumerate(reversed(self.project.layers)):
             z_value = self.Z_DATA_LAYERS_BASE + i
-            for feature in layer['features']:
-                geom_dict = feature.get('geometry')
-                if not geom_dict: continue
-                shapely_geom = shape(geom_dict)
-                if shapely_geom.is_empty: continue
-                self._draw_feature(feature, shapely_geom, layer, z_value)
+            store = get_geometry_store(layer)
+            # 用紙の範囲(+余白)に掛かる地物だけを空間インデックスで選び、範囲に収まらないものは切り取って描く
+            feature_indices = np.sort(store.get_tree().query(cull_window, predicate='intersects'))
+            needs_clip = ~shapely.contains(cull_window, store.geoms[feature_indices])
+            draw_geoms = store.get_simplified_geoms(lod_tolerance, feature_indices) if lod_tolerance else store.geoms[feature_indices]
+            feature_table = layer['features']
+            for feature_index, clip, draw_geom in zip(feature_indices, needs_clip, draw_geoms):
+                props, shapely_geom = feature_table.get_style_properties(feature_index), store.geoms[feature_index]
+                if draw_geom is None: draw_geom = shapely_geom
+                cache_key = (id(store), feature_index)
+                render_data = self._get_feature_render_data(previous_cache.get(cache_key), store, props, shapely_geom, draw_geom, lod_tolerance, layer,
+                                                            clip_window=cull_window if clip else None, clip_key=cull_key if clip else None)
+                if render_data is None: continue
+                self._feature_render_cache[cache_key] = render_data
+                self._draw_feature(feature_table.ids[feature_index], props, shapely_geom, layer, z_value, render_data, item_transform, scale)
+        return True
 
-        self.draw_compass()
-        self.draw_area_labels()
+    def _get_rotation_matrix(self):
+        """地図の回転 (原点周り) の 2x2 行列"""
+        theta = np.radians(self.project.map_rotation)
+        return np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+
+    def _get_cull_window(self, margin):
+        """
+        描画対象を絞り込む範囲 (用紙の範囲に margin を加えた矩形) のワールド座標ポリゴンと、
+        その範囲を識別するキー (切り取ったパスのキャッシュの照合用) を返す。
+        """
+        page_rect = self.get_page_rect().adjusted(-margin, -margin, margin, margin)
+        window = self.transform.scene_geom_to_world_geom(box(page_rect.left(), page_rect.top(), page_rect.right(), page_rect.bottom()))
+        shapely.prepare(window)
+        return window, (tuple(self.transform.matrix), page_rect.getRect())
+
+    def _get_feature_item_transform(self):
+        """
+        回転済みのワールド座標で作ったパスをシーン座標へ写す QTransform。
+        ワールド→シーン変換から回転を除いた縮尺・Y軸反転・平行移動の部分にあたる。
+        """
+        m = self.transform.matrix
+        if m is None: return None
+        linear = np.array([[m[0], m[1]], [m[2], m[3]]]) @ self._get_rotation_matrix().T
+        return QTransform(linear[0, 0], linear[1, 0], linear[0, 1], linear[1, 1], m[4], m[5])
+
+    def _get_feature_render_data(self, cached, store, props, shapely_geom, draw_geom, lod_tolerance, layer_info, clip_window=None, clip_key=None):
+        """
+        地物の描画用データ (draw_geom から作った回転済みワールド座標のパスと解決済みのペン・ブラシ) を返す。
+        clip_window を指定すると draw_geom をその範囲で切り取ってからパスを作る。
+        キャッシュがあれば使い回し、回転角・簡略化の段階・切り取り範囲のいずれかが変わればパスを、
+        スタイル属性が変わればペン・ブラシを作り直す。
+        """
+        if cached is not None and cached['store'] is not store: cached = None
+        rotation = self.project.map_rotation
+        style_key = tuple(str(props.get(name)) for name in ('fill_color', 'strk_style', 'strk_color', 'strk_width'))
+        try:
+            if cached is not None and cached['rotation'] == rotation and cached['lod_tolerance'] == lod_tolerance and cached['clip_key'] == clip_key:
+                path = cached['path']
+            else:
+                if clip_window is not None:
+                    try:
+                        draw_geom = shapely.intersection(draw_geom, clip_window)
+                    except shapely.errors.GEOSException:
+                        pass  # 切り取れない無効なジオメトリはそのまま描く
+                rotation_matrix = self._get_rotation_matrix()
+                rotated_geom = shapely.transform(draw_geom, lambda coords: coords @ rotation_matrix.T)
+                path = self._create_path(rotated_geom)
+                if 'Polygon' in shapely_geom.geom_type:
+                    path.setFillRule(Qt.FillRule.OddEvenFill)
+
+            if cached is not None and cached['style_key'] == style_key:
+                pen, brush = cached['pen'], cached['brush']
+            else:
+                style = self._get_feature_style(props, layer_info)
+                pen = QPen()
+                pen.setColor(style['line_color'])
+                pen.setStyle(style['pen_style'])
+                pen.setWidthF(style['line_width'] * 5.0)
+                pen.setCosmetic(False)
+                brush = QBrush(style['fill_color'])
+        except Exception as e:
+            print(f"警告: フィーチャ描画をスキップ。理由: {e}")
+            return None
 
-    def _draw_feature(self, feature, shapely_geom, layer_info, z_value):
+        return {'store': store, 'rotation': rotation, 'lod_tolerance': lod_tolerance, 'clip_key': clip_key, 'style_key': style_key, 'path': path, 'pen': pen, 'brush': brush}
+
+    def _create_path(self, geom):
+        path = QPainterPath()
+        if geom.geom_type == 'Polygon':
+            path.addPolygon(QPolygonF([QPointF(x,y) for x,y in geom.exterior.coords]))
+            for interior in geom.interiors: path.addPolygon(QPolygonF([QPointF(x,y) for x,y in interior.coords]))
+        elif geom.geom_type == 'MultiPolygon':
+            for poly in geom.geoms:
+                path.addPolygon(QPolygonF([QPointF(x,y) for x,y in poly.exterior.coords]))
+                for interior in poly.interiors: path.addPolygon(QPolygonF([QPointF(x,y) for x,y in interior.coords]))
+        elif geom.geom_type == 'LineString':
+            q_points = [QPointF(x,y) for x,y in geom.coords]
+            if len(q_points) > 1: path.moveTo(q_points[0]); [path.lineTo(p) for p in q_points[1:]]
+        elif geom.geom_type == 'MultiLineString':
+            for line in geom.geoms:
+                q_points = [QPointF(x,y) for x,y in line.coords]
+                if len(q_points) > 1: path.moveTo(q_points[0]); [path.lineTo(p) for p in q_points[1:]]
+        elif geom.geom_type == 'GeometryCollection':
+            for part in geom.geoms: path.addPath(self._create_path(part))
+        return path
+
+    def _draw_feature(self, feature_id, props, shapely_geom, layer_info, z_value, render_data, item_transform, scale):
         try:
-            style = self._get_feature_style(feature, layer_info)
-            
-            pen = QPen()
-            pen.setColor(style['line_color'])
-            pen.setStyle(style['pen_style'])
+            if render_data['path'].isEmpty(): return
+
+            # パスはワールド単位なので、シーン上の線幅になるようペン幅を縮尺で割り戻す
+            pen = QPen(render_data['pen'])
+            pen.setWidthF(render_data['pen'].widthF() / scale)
+            # シーンに追加する前に変換を設定し、外接矩形の再計算を1回で済ませる
+            item = QGraphicsPathItem(render_data['path'])
+            item.setPen(pen)
+            if 'Polygon' in shapely_geom.geom_type:
+                item.setBrush(render_data['brush'])
+            item.setTransform(item_transform)
+            item.setZValue(z_value)
+            self.scene.addItem(item)
+            layer_info['graphics_items'].append(item)
 
-            pen_width_in_scene_units = style['line_width'] * 5.0
-            pen.setWidthF(pen_width_in_scene_units)
-            pen.setCosmetic(False)
+            meter_value = props.get('meter')
 
-            brush = QBrush(style['fill_color'])
-            
-            scene_geom = self.world_geom_to_scene_geom(shapely_geom)
-            if not scene_geom or scene_geom.is_empty: return
-
-            def create_path(geom):
-                path = QPainterPath()
-                if geom.geom_type == 'Polygon':
-                    path.addPolygon(QPolygonF([QPointF(x,y) for x,y in geom.exterior.coords]))
-                    for interior in geom.interiors: path.addPolygon(QPolygonF([QPointF(x,y) for x,y in interior.coords]))
-                elif geom.geom_type == 'MultiPolygon':
-                    for poly in geom.geoms:
-                        path.addPolygon(QPolygonF([QPointF(x,y) for x,y in poly.exterior.coords]))
-                        for interior in poly.interiors: path.addPolygon(QPolygonF([QPointF(x,y) for x,y in interior.coords]))
-                elif geom.geom_type == 'LineString':
-                    q_points = [QPointF(x,y) for x,y in geom.coords]
-                    if len(q_points) > 1: path.moveTo(q_points[0]); [path.lineTo(p) for p in q_points[1:]]
-                elif geom.geom_type == 'MultiLineString':
-                    for line in geom.geoms:
-                        q_points = [QPointF(x,y) for x,y in line.coords]
-                        if len(q_points) > 1: path.moveTo(q_points[0]); [path.lineTo(p) for p in q_points[1:]]
-                return path
-
-            path = create_path(scene_geom)
-            if 'Polygon' in shapely_geom.geom_type:
-                path.setFillRule(Qt.FillRule.OddEvenFill)
-                item = self.scene.addPath(path, pen, brush)
-            else:
-                item = self.scene.addPath(path, pen)
-            if item:
-                item.setZValue(z_value)
-                layer_info['graphics_items'].append(item)
+            if meter_value is not None and ('LineString' in shapely_geom.geom_type or 'MultiLineString' in shapely_geom.geom_type):
+                try:
+                    geoms_to_label = shapely_geom.geoms if shapely_geom.geom_type == 'MultiLineString' else [shapely_geom]
+                    
+                    for i, single_line_geom in enumerate(geoms_to_label):
+                        if single_line_geom.is_empty: continue
+                        
+                        unique_id = (layer_info['path'], layer_info['layer_name'], feature_id if feature_id is not None else -1, i)
+                        world_pos = self.project.get_label_position(unique_id)
+                        
+                        if world_pos is None:
+                            world_pos = (single_line_geom.centroid.x, single_line_geom.centroid.y)
 
-                props = feature.get('properties', {})
-                meter_value = props.get('meter')
+                        scene_label_pos = self.world_geom_to_scene_geom(shape({'type': 'Point', 'coordinates': world_pos}))
+                        if not scene_label_pos: continue
 
-                if meter_value is not None and ('LineString' in shapely_geom.geom_type or 'MultiLineString' in shapely_geom.geom_type):
-                    try:
-                        geoms_to_label = shapely_geom.geoms if shapely_geom.geom_type == 'MultiLineString' else [shapely_geom]
+                        label_text = f"{meter_value}m"
+                        text_item = DraggableLabelItem(label_text, unique_id, is_annotation=False)
+                        text_item.setDefaultTextColor(self.colors['dark'])
+                        text_item.setFont(self.fonts['data_bold'])
+                        
+                        text_rect = text_item.boundingRect()
+                        text_item.setPos(scene_label_pos.x - text_rect.width() / 2, scene_label_pos.y - text_rect.height() / 2)
+                        
+                        text_item.setZValue(z_value + 1)
+                        self.scene.addItem(text_item)
                         
-                        for i, single_line_geom in enumerate(geoms_to_label):
-                            if single_line_geom.is_empty: continue
-                            
-                            unique_id = (layer_info['path'], layer_info['layer_name'], feature.get('id', -1), i)
-                            world_pos = self.project.get_label_position(unique_id)
-                            
-                            if world_pos is None:
-                                world_pos = (single_line_geom.centroid.x, single_line_geom.centroid.y)
-
-                            scene_label_pos = self.world_geom_to_scene_geom(shape({'type': 'Point', 'coordinates': world_pos}))
-                            if not scene_label_pos: continue
-
-                            label_text = f"{meter_value}m"
-                            text_item = DraggableLabelItem(label_text, unique_id, is_annotation=False)
-                            text_item.setDefaultTextColor(self.colors['dark'])
-                            text_item.setFont(self.fonts['data_bold'])
-                            
-                            text_rect = text_item.boundingRect()
-                            text_item.setPos(scene_label_pos.x - text_rect.width() / 2, scene_label_pos.y - text_rect.height() / 2)
-                            
-                            text_item.setZValue(z_value + 1)
-                            self.scene.addItem(text_item)
-                            
-                            text_item.positionChanged.connect(self._handle_label_moved)
-
-                            layer_info['graphics_items'].append(text_item)
-                            
-                    except Exception as text_e:
-                        print(f"警告: メートル属性テキスト描画をスキップ。理由: {text_e}")
+                        text_item.positionChanged.connect(self._handle_label_moved)
+
+                        layer_info['graphics_items'].append(text_item)
+                        
+                except Exception as text_e:
+                    print(f"警告: メートル属性テキスト描画をスキップ。理由: {text_e}")
 
         except Exception as e:
             print(f"警告: フィーチャ描画をスキップ。理由: {e}")
@@ -667,6 +805,25 @@ class MapRenderer:
         pointer_item = self.scene.addEllipse(center_x - point_size / 2, center_y - point_size / 2, point_size, point_size, QPen(color, 1), QBrush(color))
         pointer_item.setZValue(self.Z_OVERLAYS_BASE + 2); self.pointer_items.append(pointer_item)
 
+    def draw_landing_suggestion(self, landing_cell):
+        """平均集材距離が最小となる土場候補セルを破線の円で示す"""
+        self.clear_landing_suggestion()
+        row, col = landing_cell
+        cs = self.project.cell_size_on_screen
+        center_x = self.grid_offset_x + col * cs + cs / 2
+        center_y = self.grid_offset_y + row * cs + cs / 2
+        size = cs * 0.8
+
+        pen = QPen(QColor(0, 150, 0), 2, Qt.PenStyle.DashLine)
+        pen.setCosmetic(True)
+        self.landing_suggestion_item = self.scene.addEllipse(center_x - size / 2, center_y - size / 2, size, size, pen)
+        self.landing_suggestion_item.setZValue(self.Z_OVERLAYS_BASE + 2)
+
+    def clear_landing_suggestion(self):
+        if self.landing_suggestion_item and self.landing_suggestion_item.scene():
+            self.scene.removeItem(self.landing_suggestion_item)
+        self.landing_suggestion_item = None
+
     def clear_all_pointers(self):
         for item in self.pointer_items:
             if item.scene(): self.scene.removeItem(item)
@@ -1100,28 +1257,9 @@ class MapRenderer:
         self._setup_drawing_styles()
 
     def _get_transform_parameters(self):
-        if not self.project.master_bbox: return None
-        rotated_corners = self._apply_rotation_to_coords([(self.project.master_bbox[0], self.project.master_bbox[1]),(self.project.master_bbox[2], self.project.master_bbox[3]),(self.project.master_bbox[2], self.project.master_bbox[1]),(self.project.master_bbox[0], self.project.master_bbox[3])])
-        xs, ys = [p[0] for p in rotated_corners], [p[1] for p in rotated_corners]
-        bbox_to_use, scale = (min(xs), min(ys), max(xs), max(ys)), self.project.cell_size_on_screen / self.project.k_value
-        center_x, center_y = bbox_to_use[0] + (bbox_to_use[2] - bbox_to_use[0])/2, bbox_to_use[1] + (bbox_to_use[3] - bbox_to_use[1])/2
-        grid_center_x, grid_center_y = self.grid_offset_x + (self.project.grid_cols*self.project.cell_size_on_screen)/2, self.grid_offset_y + (self.project.grid_rows*self.project.cell_size_on_screen)/2
-        
-        # MODIFIED: パン操作のオフセットを、画面表示とPDF出力の両方で適用するように修正
-        grid_center_x += self.project.map_offset_x
-        grid_center_y += self.project.map_offset_y
-            
-        return {'scale': scale, 'center_x': center_x, 'center_y': center_y, 'grid_center_x': grid_center_x, 'grid_center_y': grid_center_y}
+        return self.transform.get_parameters()
     
-    def _apply_rotation_to_coords(self, coords, inverse=False):
-        if self.project.map_rotation == 0 or not self.project.master_bbox: return coords
-        orig_center_x, orig_center_y = self.project.master_bbox[0] + (self.project.master_bbox[2]-self.project.master_bbox[0])/2, self.project.master_bbox[1] + (self.project.master_bbox[3]-self.project.master_bbox[1])/2
-        angle, theta = -self.project.map_rotation if inverse else self.project.map_rotation, math.radians(-self.project.map_rotation if inverse else self.project.map_rotation)
-        cos_theta, sin_theta = math.cos(theta), math.sin(theta)
-        return [((p_x-orig_center_x)*cos_theta - (p_y-orig_center_y)*sin_theta + orig_center_x, (p_x-orig_center_x)*sin_theta + (p_y-orig_center_y)*cos_theta + orig_center_y) for p_x, p_y in coords]
-
-    def _get_feature_style(self, feature, layer_info):
-        props = feature.get('properties', {})
+    def _get_feature_style(self, props, layer_info):
         final_style = DEFAULT_STYLE_INFO.copy()
         fill_color_prop = props.get('fill_color')
         if fill_color_prop and str(fill_color_prop).strip():
@@ -76,6 +76,11 @@ class ReportGenerator:
         report_blocks.append({'type': 'note', 'text': "※ 区域面積は、集材区域に含まれるセルの数から算出しています。"})
 
         sub_results = [a['result'] for a in sub_area_data if a.get('result')]
+        # 参考として、セルの被覆率 (区域がセルに占める割合) の合計から求めた実面積を併記する
+        coverage_ha = sum(Decimal(str(res.get('coverage_area_ha', 0.0))) for res in sub_results)
+        if coverage_ha > 0:
+            coverage_ha = coverage_ha.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            report_blocks.append({'type': 'note', 'text': f"※ 参考: セルの被覆率から求めた区域の実面積は {coverage_ha:.2f} ha です。"})
         
         # MODIFIED: 面積計算にDecimalを使用し、小数第3位を四捨五入する
         quantizer = Decimal('0.01')
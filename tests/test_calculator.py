@@ -0,0 +1,105 @@
+"""Calculator のセル判定 (50%面積ルール) の各方式が、従来のループ実装と同じ結果になることの確認"""
+import glob
+import os
+
+import fiona
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+from batch import read_features, build_project
+from calculator import Calculator
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'サンプルベクタ')
+# 被覆率の許容誤差 (方式による差は浮動小数点の丸め程度)
+COVERAGE_TOLERANCE = 1e-9
+
+
+def _polygon_layers():
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, '*.gpkg'))):
+        for layer_name in fiona.listlayers(path):
+            if layer_name in ('layer_styles', 'gpkg_layer_styles'): continue
+            features, geom_type, _ = read_features(path, layer_name)
+            if 'Polygon' in geom_type and features:
+                yield pytest.param(path, layer_name, features, id=f"{os.path.basename(path)}-{layer_name}")
+
+
+@pytest.mark.parametrize('path, layer_name, features', list(_polygon_layers()))
+@pytest.mark.parametrize('mode', [mode for mode in Calculator.CLASSIFICATION_MODES if mode != 'loop'])
+def test_classification_matches_loop(path, layer_name, features, mode):
+    project, calculator = build_project(features, path, layer_name, 25.0, 'loop')
+    world_geom = project._get_combined_calculable_geom()
+    expected = calculator.get_coverage_for_geom(world_geom)
+
+    calculator.classification_mode = mode
+    coverage = calculator.get_coverage_for_geom(world_geom)
+
+    np.testing.assert_allclose(coverage, expected, rtol=0, atol=COVERAGE_TOLERANCE)
+    # 被覆率がちょうど50%のセルは丸め誤差で判定が分かれうるため、それ以外のセルで対象セルの一致を確認する
+    decided = np.abs(expected - Calculator.AREA_RATIO_THRESHOLD) > COVERAGE_TOLERANCE
+    threshold = Calculator.AREA_RATIO_THRESHOLD
+    assert np.array_equal((coverage >= threshold) & decided, (expected >= threshold) & decided)
+    assert expected.any()
+
+
+def _build_split_project(mode='prepared'):
+    """3林班のサンプルを、セルの中心を通る縦の分割線で分けた計算用プロジェクト"""
+    path = os.path.join(SAMPLE_DIR, '3林班いろは.gpkg')
+    features, _, _ = read_features(path, '3林班いろは')
+    project, calculator = build_project(features, path, '3林班いろは', 25.0, mode)
+    cs, transform = project.cell_size_on_screen, calculator.transform
+    x = transform.grid_offset_x + (project.grid_cols // 2 + 0.5) * cs
+    start = transform.scene_to_world(x, transform.grid_offset_y - cs)
+    end = transform.scene_to_world(x, transform.grid_offset_y + (project.grid_rows + 1) * cs)
+    project.split_lines = [LineString([start, end])]
+    project.is_split_mode = True
+    project.prepare_sub_areas()
+    for area_data in project.sub_area_data:
+        cells = calculator.get_cells_for_geom(area_data['geom'])
+        area_data['calc_mode'], area_data['landing_cell'] = 'internal', cells[len(cells) // 2]
+    return project, calculator
+
+
+def test_split_coverage_stack_matches_per_area():
+    project, calculator = _build_split_project()
+    calculator.use_coverage_stack = False
+    expected = calculator.run_calculation()['summary_result']
+    expected_cells = [area_data['result']['in_area_cells'] for area_data in project.sub_area_data]
+
+    calculator.use_coverage_stack = True
+    calculator.invalidate_coverage_cache()
+    result = calculator.run_calculation()['summary_result']
+    cells = [area_data['result']['in_area_cells'] for area_data in project.sub_area_data]
+
+    # 分割線がセルの中心を通るため、ちょうど50%ずつの境界セルが両方の区域に数えられる
+    assert sum(len(c) for c in cells) > len(set().union(*map(set, cells)))
+    assert cells == expected_cells
+    assert result['total_degree'] == expected['total_degree']
+    assert result['final_distance'] == pytest.approx(expected['final_distance'])
+
+
+@pytest.mark.parametrize('path, layer_name, features', list(_polygon_layers()))
+def test_landing_distance_grid_matches_per_cell_calculation(path, layer_name, features):
+    project, calculator = build_project(features, path, layer_name, 25.0, 'prepared')
+    world_geom = project._get_combined_calculable_geom()
+    coverage = calculator.get_coverage_for_geom(world_geom)
+    distance_grid = calculator.get_landing_distance_grid(coverage)
+    if distance_grid is None:
+        # 50%以上を占めるセルがない小さな区域 (土場レイヤなど) は、通常の計算でも結果がない
+        area_data = {'geom': world_geom, 'calc_mode': 'internal', 'landing_cell': (0, 0)}
+        assert calculator._calculate_for_area(area_data) is None
+        assert calculator.find_optimal_landing(world_geom, 'internal') == (None, None)
+        return
+
+    # 全セルをそれぞれ土場として、通常の計算 (_calculate_for_area) をやり直した結果と比べる
+    expected = np.empty((project.grid_rows, project.grid_cols))
+    for row in range(project.grid_rows):
+        for col in range(project.grid_cols):
+            area_data = {'geom': world_geom, 'calc_mode': 'internal', 'landing_cell': (row, col)}
+            expected[row, col] = calculator._calculate_for_area(area_data)['internal_distance']
+    np.testing.assert_allclose(distance_grid, expected, rtol=1e-12)
+
+    landing_cell, distance = calculator.find_optimal_landing(world_geom, 'internal')
+    in_area = coverage >= Calculator.AREA_RATIO_THRESHOLD
+    assert in_area[landing_cell]
+    assert distance == pytest.approx(expected[in_area].min())
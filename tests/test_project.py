@@ -0,0 +1,39 @@
+"""Project の結合ジオメトリのキャッシュの確認"""
+import os
+
+from batch import read_features
+from feature_table import FeatureTable
+from project import Project
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'サンプルベクタ', 'Sample.gpkg')
+
+
+def _build_project(layer_names):
+    project = Project()
+    for layer_name in layer_names:
+        features, geom_type, _ = read_features(SAMPLE_PATH, layer_name)
+        project.add_layer({
+            'path': SAMPLE_PATH, 'layer_name': layer_name, 'geom_type': geom_type, 'features': FeatureTable.from_features(features),
+            'graphics_items': [], 'is_calculable': True, 'is_calc_target': True
+        })
+    return project
+
+
+def test_combined_geom_cache_survives_unchanged_target_status():
+    project = _build_project(['ポリゴン', '小班界'])
+    both = project._get_combined_calculable_geom()
+    assert (project.geom_cache_hits, project.geom_cache_misses) == (0, 1)
+
+    # 計算対象の状態が変わらない更新ではキャッシュを捨てない
+    project.set_calc_target_status(0, True)
+    project.set_calc_target_status(1, True)
+    assert project._get_combined_calculable_geom() is both
+    assert (project.geom_cache_hits, project.geom_cache_misses) == (1, 1)
+
+    # 計算対象を外すと結合し直す
+    project.set_calc_target_status(1, False)
+    only_first = project._get_combined_calculable_geom()
+    assert only_first is not both
+    assert (project.geom_cache_hits, project.geom_cache_misses) == (1, 2)
+    assert only_first.equals(project._get_combined_calculable_geom())
+    assert (project.geom_cache_hits, project.geom_cache_misses) == (2, 2)
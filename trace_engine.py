@@ -0,0 +1,55 @@
+#--- START OF FILE trace_engine.py ---
+import numpy as np
+
+
+class LineTracer:
+    """
+    1本の線(LineString)に沿って2点間の頂点列を取り出す線形参照エンジン。
+    各頂点までの累積距離を作成時に一度だけ求めておき、点の位置の特定は全線分への一括射影、
+    区間の取り出しは累積距離の二分探索と配列のスライスで行う。
+    閉じた線(ポリゴンの境界など)では、始点と終点を結ぶ2方向のうち短い方をたどる。
+    """
+    def __init__(self, line):
+        self.coords = np.asarray(line.coords, dtype=float)[:, :2]
+        segment_vectors = np.diff(self.coords, axis=0)
+        self._segment_starts = self.coords[:-1]
+        self._segment_vectors = segment_vectors
+        self._segment_sq_lengths = (segment_vectors ** 2).sum(axis=1)
+        self.cumulative = np.concatenate([[0.0], np.cumsum(np.sqrt(self._segment_sq_lengths))])
+        self.length = float(self.cumulative[-1])
+        self.is_closed = len(self.coords) > 3 and np.array_equal(self.coords[0], self.coords[-1])
+        if self.is_closed:
+            # 一周分つなげた配列にしておくと、始点をまたぐ区間も1回のスライスで取り出せる
+            self._coords_unrolled = np.concatenate([self.coords, self.coords[1:]])
+            self._cumulative_unrolled = np.concatenate([self.cumulative, self.cumulative[1:] + self.length])
+
+    def locate(self, x, y):
+        """(x, y) を線に射影したときの、始点からの距離と線までの距離を返す"""
+        if len(self._segment_starts) == 0: return 0.0, float(np.hypot(*(self.coords[0] - (x, y))))
+        offsets = np.array([x, y]) - self._segment_starts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(self._segment_sq_lengths > 0, (offsets * self._segment_vectors).sum(axis=1) / self._segment_sq_lengths, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        distances = np.hypot(*(offsets - t[:, None] * self._segment_vectors).T)
+        best = int(np.argmin(distances))
+        return float(self.cumulative[best] + t[best] * np.sqrt(self._segment_sq_lengths[best])), float(distances[best])
+
+    def _vertices_between(self, coords, cumulative, d0, d1):
+        """累積距離が d0 < d < d1 の範囲にある頂点を始点側から順に返す"""
+        lo = np.searchsorted(cumulative, d0, side='right')
+        hi = np.searchsorted(cumulative, d1, side='left')
+        return coords[lo:hi]
+
+    def get_vertices_between(self, start_dist, end_dist):
+        """始点からの距離 start_dist の位置から end_dist の位置までの間にある頂点を、たどる順に返す"""
+        if not self.is_closed:
+            if start_dist <= end_dist:
+                return self._vertices_between(self.coords, self.cumulative, start_dist, end_dist)
+            return self._vertices_between(self.coords, self.cumulative, end_dist, start_dist)[::-1]
+
+        forward_length = (end_dist - start_dist) % self.length
+        if forward_length <= self.length - forward_length:
+            end_unrolled = end_dist if end_dist >= start_dist else end_dist + self.length
+            return self._vertices_between(self._coords_unrolled, self._cumulative_unrolled, start_dist, end_unrolled)
+        start_unrolled = start_dist if start_dist >= end_dist else start_dist + self.length
+        return self._vertices_between(self._coords_unrolled, self._cumulative_unrolled, end_dist, start_unrolled)[::-1]
@@ -1,7 +1,7 @@
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QCheckBox, QDialogButtonBox, QListWidget, QGraphicsView, QMenu,
     QWidget, QFormLayout, QLineEdit, QPushButton, QHBoxLayout, QColorDialog, QFontComboBox,
-    QSpinBox, QButtonGroup, QGridLayout
+    QSpinBox, QButtonGroup, QGridLayout, QMessageBox
 )
 from PyQt6.QtCore import pyqtSignal, Qt, QPointF, QPoint, QRectF
 from PyQt6.QtGui import QPainter, QColor, QPen, QBrush, QKeyEvent, QFont
@@ -154,6 +154,29 @@ class LayerSelectionDialog(QDialog):
             if name in ['layer_styles', 'gpkg_layer_styles']: continue
             cb = QCheckBox(name); cb.setChecked(True)
             self.checkboxes.append(cb); self.layout.addWidget(cb)
+
+        # 大きなファイルから対象の区域(とその周辺)だけを読み込むための絞り込み条件
+        self.filter_checkbox = QCheckBox("範囲を絞って読み込む")
+        self.layout.addWidget(self.filter_checkbox)
+        self.filter_widget = QWidget()
+        filter_layout = QFormLayout(self.filter_widget)
+        filter_layout.setContentsMargins(20, 0, 0, 0)
+        self.where_edit = QLineEdit()
+        self.where_edit.setPlaceholderText("例: 林班 = '12' AND 小班 = 'い'")
+        self.buffer_spin = QSpinBox()
+        self.buffer_spin.setRange(0, 100000)
+        self.buffer_spin.setValue(200)
+        self.buffer_spin.setSuffix(" m")
+        self.buffer_spin.setToolTip("属性条件に一致した地物からこの距離までにある地物を、全ての選択レイヤから周辺として読み込みます。\n0の場合は条件に一致した地物だけを読み込みます。")
+        self.bbox_edit = QLineEdit()
+        self.bbox_edit.setPlaceholderText("xmin, ymin, xmax, ymax (省略可)")
+        filter_layout.addRow("属性条件:", self.where_edit)
+        filter_layout.addRow("周辺の範囲:", self.buffer_spin)
+        filter_layout.addRow("座標範囲:", self.bbox_edit)
+        self.filter_widget.setEnabled(False)
+        self.filter_checkbox.toggled.connect(self.filter_widget.setEnabled)
+        self.layout.addWidget(self.filter_widget)
+
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         button_box.accepted.connect(self.accept); button_box.rejected.connect(self.reject)
         self.layout.addWidget(button_box)
@@ -166,6 +189,31 @@ class LayerSelectionDialog(QDialog):
     def get_selected_layers(self):
         return [cb.text() for cb in self.checkboxes if cb.isChecked()]
 
+    def _parse_bbox(self):
+        """座標範囲の入力を (xmin, ymin, xmax, ymax) に変換する。未入力なら None、不正なら ValueError"""
+        text = self.bbox_edit.text().strip()
+        if not text: return None
+        values = [float(v) for v in text.replace('、', ',').split(',')]
+        if len(values) != 4 or values[0] >= values[2] or values[1] >= values[3]:
+            raise ValueError(text)
+        return tuple(values)
+
+    def accept(self):
+        if self.filter_checkbox.isChecked():
+            try:
+                self._parse_bbox()
+            except ValueError:
+                QMessageBox.warning(self, "入力エラー", "座標範囲は「xmin, ymin, xmax, ymax」の形式で入力してください。")
+                return
+        super().accept()
+
+    def get_read_filter(self):
+        """絞り込み条件 (where / bbox / buffer の辞書)。絞り込まない場合は None"""
+        if not self.filter_checkbox.isChecked(): return None
+        where, bbox = self.where_edit.text().strip(), self._parse_bbox()
+        if not where and not bbox: return None
+        return {'where': where or None, 'bbox': bbox, 'buffer': self.buffer_spin.value() if where else 0}
+
 
 class DroppableListWidget(QListWidget):
     filesDropped = pyqtSignal(list)
@@ -324,6 +372,8 @@ class MyGraphicsView(QGraphicsView):
                 
                 self.is_panning = True
                 self.last_pan_point = event.pos()
+                if self.main_window:
+                    self.main_window.renderer.begin_pan()
                 self.viewport().setCursor(Qt.CursorShape.ClosedHandCursor)
                 super().mousePressEvent(event)
                 return
@@ -373,9 +423,7 @@ class MyGraphicsView(QGraphicsView):
         if self.is_panning:
             delta = event.pos() - self.last_pan_point
             if self.main_window:
-                self.main_window.project.map_offset_x += delta.x()
-                self.main_window.project.map_offset_y += delta.y()
-                self.main_window.renderer.full_redraw()
+                self.main_window.renderer.pan_by(delta.x(), delta.y())
             self.last_pan_point = event.pos()
             return
         
@@ -398,7 +446,7 @@ class MyGraphicsView(QGraphicsView):
                 self.is_panning = False
                 self.viewport().setCursor(Qt.CursorShape.ArrowCursor)
                 if self.main_window and self.main_window.renderer:
-                    self.main_window.renderer.full_redraw()
+                    self.main_window.renderer.end_pan()
                     self.main_window.update_area_display()
 
         elif event.button() == Qt.MouseButton.RightButton:
@@ -426,4 +474,5 @@ class MyGraphicsView(QGraphicsView):
              grid_rect = self.main_window.renderer.get_grid_rect()
              bounding_rect = all_items_rect.united(grid_rect)
              if bounding_rect.isValid():
-                self.fitInView(bounding_rect.adjusted(-20, -20, 20, 20), Qt.AspectRatioMode.KeepAspectRatio)
\ No newline at end of file
+                self.fitInView(bounding_rect.adjusted(-20, -20, 20, 20), Qt.AspectRatioMode.KeepAspectRatio)
+                self.viewZoomed.emit()
\ No newline at end of file
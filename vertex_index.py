@@ -0,0 +1,59 @@
+#--- START OF FILE vertex_index.py ---
+import numpy as np
+
+
+class VertexGridIndex:
+    """
+    頂点座標の格子ハッシュ索引。
+    頂点を一辺 cell_size の格子に振り分けて格子番号順に並べておき、検索時は
+    検索円に掛かる格子だけを二分探索で取り出して距離を計算する。
+    """
+    def __init__(self, coords, geom_indices, cell_size=None):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        self.origin = coords.min(axis=0) if len(coords) > 0 else np.zeros(2)
+        if cell_size is None:
+            # 1つの格子に平均して数個の頂点が入る大きさにする
+            extent = np.ptp(coords, axis=0).max() if len(coords) > 0 else 0.0
+            cell_size = extent / max(np.sqrt(len(coords) / 4), 1.0)
+        self.cell_size = float(cell_size) if cell_size > 0 else 1.0
+
+        cells = np.floor((coords - self.origin) / self.cell_size).astype(np.int64)
+        self._max_cell_x = int(cells[:, 0].max()) if len(coords) > 0 else 0
+        self._row_stride = int(cells[:, 1].max()) + 1 if len(coords) > 0 else 1
+        keys = cells[:, 0] * self._row_stride + cells[:, 1]
+        order = np.argsort(keys, kind='stable')
+        self.coords = coords[order]
+        self.geom_indices = np.asarray(geom_indices)[order]
+        self._keys, self._starts = np.unique(keys[order], return_index=True)
+        self._ends = np.append(self._starts[1:], len(keys))
+
+    def __len__(self):
+        return len(self.coords)
+
+    def query_nearest(self, x, y, max_distance):
+        """
+        (x, y) から max_distance 以内で最も近い頂点の (座標, ジオメトリ番号, 距離) を返す。
+        同じ距離の頂点が複数ある場合はジオメトリ番号の小さいものを返す。見つからなければ None。
+        """
+        if len(self.coords) == 0: return None
+        lo = np.floor((np.array([x, y]) - max_distance - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((np.array([x, y]) + max_distance - self.origin) / self.cell_size).astype(np.int64)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, [self._max_cell_x, self._row_stride - 1])
+        if (hi < lo).any(): return None
+
+        cell_x, cell_y = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1), indexing='ij')
+        keys = (cell_x * self._row_stride + cell_y).ravel()
+        positions = np.searchsorted(self._keys, keys)
+        found = positions < len(self._keys)
+        found[found] = self._keys[positions[found]] == keys[found]
+        positions = positions[found]
+        if len(positions) == 0: return None
+
+        candidates = np.concatenate([np.arange(self._starts[p], self._ends[p]) for p in positions])
+        distances = np.hypot(self.coords[candidates, 0] - x, self.coords[candidates, 1] - y)
+        within = distances <= max_distance
+        if not within.any(): return None
+        candidates, distances = candidates[within], distances[within]
+        best = np.lexsort((self.geom_indices[candidates], distances))[0]
+        return tuple(self.coords[candidates[best]]), int(self.geom_indices[candidates[best]]), float(distances[best])